@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+
+
+# Runs coroutines on one long-lived event loop owned by a daemon thread, so
+# synchronous request handlers of any thread can hand I/O fan-out (many
+# concurrent workspace calls) to it and wait for the result. The loop thread is
+# started on first use, which keeps the executor safe to create before the
+# server forks its workers.
+class AsyncExecutor:
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def _get_loop(self):
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="AsyncExecutor",
+                                 daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def run(self, coro):
+        """
+        Run the coroutine on the executor's loop and return its result (or
+        raise its exception) in the calling thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+
+# shared by all requests served by the worker process
+async_executor = AsyncExecutor()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from installed_clients.asyncbaseclient import AsyncBaseClient
+
+
+# Asyncio counterpart of the Workspace client for the calls the fan-out paths
+# need. Calls made inside one "async with" block share a pool of at most
+# max_concurrency keep-alive connections, so dozens of them can be awaited
+# together from a single thread while only max_concurrency are in flight.
+class AsyncWorkspace:
+
+    def __init__(self, url, token=None, timeout=30 * 60, max_concurrency=10):
+        self._client = AsyncBaseClient(url, timeout=timeout, token=token,
+                                       max_concurrency=max_concurrency)
+
+    async def __aenter__(self):
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.close()
+
+    async def get_objects2(self, params):
+        return await self._client.call_method('Workspace.get_objects2', [params])
+
+    async def get_object_info3(self, params):
+        return await self._client.call_method('Workspace.get_object_info3', [params])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+
+from PanGenomeAPI.LRUCache import LRUCache
+
+# numeric workspace id / object id / version, the only refs that can never
+# point to another object (names can be reused after a rename or delete)
+PINNED_REF = re.compile(r"^\d+/\d+/\d+$")
+
+
+def is_pinned_ref(ref):
+    """
+    True if every step of the ref path is a numeric, versioned ref.
+    """
+    return all(PINNED_REF.match(step.strip()) for step in ref.split(";"))
+
+
+def user_key(token):
+    """
+    Key of the user of a token in the caches scoped by user.
+    """
+    return hashlib.sha256(str(token).encode("utf-8")).hexdigest()
+
+
+# Process-wide map of workspace refs to the inner checksum of the object they
+# point to (info[8]), which keys all local indexes. Pinned refs are cached
+# until evicted, other refs (no version, names) only for ttl seconds since a
+# new object version can be saved under them at any time. Entries are scoped
+# by user token, the workspace call is what checks that the user can read the
+# object, so a cached checksum must not be served to anyone else.
+class ChecksumCache:
+
+    def __init__(self, max_size=10000, ttl=5 * 60):
+        self.ttl = ttl
+        self.checksums = LRUCache(max_size)
+
+    def get_checksums(self, ws, token, refs):
+        """
+        Return the inner checksums of the given refs in order, the ones not
+        cached are fetched from the Workspace client (authenticated with the
+        token) with one get_object_info3 call.
+        """
+        token_key = user_key(token)
+        ret = [self.checksums.get((token_key, ref)) for ref in refs]
+        missing_refs = sorted(set(ref for ref, chsum in zip(refs, ret) if chsum is None))
+        if not missing_refs:
+            return ret
+        infos = ws.get_object_info3({"objects": [{"ref": ref}
+                                                 for ref in missing_refs]})['infos']
+        fetched = {}
+        for ref, info in zip(missing_refs, infos):
+            fetched[ref] = info[8]
+            self.checksums.put((token_key, ref), info[8], None if is_pinned_ref(ref) else self.ttl)
+        return [fetched[ref] if chsum is None else chsum for ref, chsum in zip(refs, ret)]
+
+    def get_checksum(self, ws, token, ref):
+        return self.get_checksums(ws, token, [ref])[0]
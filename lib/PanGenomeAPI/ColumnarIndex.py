@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+MAGIC = b"PGCIDX01"
+# footer length + magic closing every index file
+TRAILER = struct.Struct("<Q8s")
+ALIGNMENT = 8
+COPY_BUFFER_SIZE = 1 << 20
+CODECS = ("none", "gzip", "zstd", "lz4")
+# rows of a compressed string column compressed together, reading a row only
+# decompresses the block holding it
+BLOCK_ROWS = 64
+
+
+# Streaming compressor of a block with the given codec ("gzip" is built in,
+# "zstd" and "lz4" need the zstandard and lz4 packages), same interface as
+# zlib's compress objects.
+class SectionCompressor:
+
+    def __init__(self, codec, level=None):
+        self.header = b""
+        if codec == "gzip":
+            self.compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+        elif codec == "zstd":
+            import zstandard
+            self.compressor = zstandard.ZstdCompressor(
+                level=3 if level is None else level).compressobj()
+        elif codec == "lz4":
+            import lz4.frame
+            self.compressor = lz4.frame.LZ4FrameCompressor(
+                compression_level=0 if level is None else level)
+            self.header = self.compressor.begin()
+        else:
+            raise ValueError(f"Unknown index compression codec '{codec}', "
+                             f"please use one of {list(CODECS)}")
+
+    def compress(self, data):
+        header, self.header = self.header, b""
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        return self.compress(b"") + self.compressor.flush()
+
+
+def decompress_block(codec, data):
+    if codec == "gzip":
+        return zlib.decompress(data, 31)
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == "lz4":
+        import lz4.frame
+        return lz4.frame.decompress(data)
+    raise ValueError(f"Unknown index compression codec '{codec}'")
+
+
+def check_codec(codec, level=None):
+    """
+    Raise ValueError unless the codec is known and its package can be
+    imported, so a misconfigured codec fails at startup instead of on the
+    first index build.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown index compression codec '{codec}', "
+                         f"please use one of {list(CODECS)}")
+    if codec == "none":
+        return
+    try:
+        SectionCompressor(codec, level)
+    except ImportError as e:
+        raise ValueError(f"Index compression codec '{codec}' needs the "
+                         f"'{e.name}' package, which is not installed") from e
+
+
+# This class writes named binary sections (typed arrays or raw bytes) into a
+# single memory-mappable file. Sections are written back to back in one
+# sequential pass and described by a JSON footer, string columns are stored as
+# a pair of sections: "<name>.offsets" (uint64, num_rows + 1) and "<name>.data"
+# (utf-8 bytes). String data sections are compressed with the writer's codec
+# in blocks of BLOCK_ROWS rows, each block on its own, the compressed offsets
+# of the blocks go to a "<name>.data.blocks" section (uint64, num_blocks + 1).
+# All other sections are stored as is so they can be used straight from the
+# memory map. The file becomes visible under its final name only on commit.
+class ColumnarIndexWriter:
+
+    def __init__(self, index_file, codec="none", level=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown index compression codec '{codec}', "
+                             f"please use one of {list(CODECS)}")
+        self.index_file = index_file
+        self.codec = codec
+        self.level = level
+        self.outfile = tempfile.NamedTemporaryFile(dir=os.path.dirname(index_file),
+                                                   prefix=os.path.basename(index_file) + "_",
+                                                   suffix=".tmp", delete=False)
+        self.outfile.write(MAGIC)
+        self.position = len(MAGIC)
+        self.sections = {}
+        self.meta = {}
+
+    def _pad(self):
+        padding = -self.position % ALIGNMENT
+        if padding:
+            self.outfile.write(b"\0" * padding)
+            self.position += padding
+
+    def _add_section(self, name, typecode, chunks, codec="none", block_rows=None):
+        if name in self.sections:
+            raise ValueError(f"Duplicate index section '{name}'")
+        self._pad()
+        offset = self.position
+        for chunk in chunks:
+            self.outfile.write(chunk)
+            self.position += len(chunk)
+        self.sections[name] = [offset, self.position - offset, typecode, codec]
+        if block_rows is not None:
+            self.sections[name].append(block_rows)
+
+    def add_bytes(self, name, data):
+        self._add_section(name, "B", [data])
+
+    def add_array(self, name, values):
+        if not isinstance(values, array):
+            raise ValueError(f"Section '{name}' must be an array.array")
+        self._add_section(name, values.typecode, [values.tobytes()])
+
+    def add_file(self, name, source, typecode="B"):
+        source.seek(0)
+        self._add_section(name, typecode, iter(lambda: source.read(COPY_BUFFER_SIZE), b""))
+
+    def add_blocks(self, name, blocks, block_rows):
+        """
+        Add a section made of blocks (bytes) of block_rows rows each, which
+        are compressed one by one with the writer's codec.
+        """
+        block_offsets = array("Q", [0])
+
+        def compress():
+            for block in blocks:
+                compressor = SectionCompressor(self.codec, self.level)
+                data = compressor.compress(block) + compressor.flush()
+                block_offsets.append(block_offsets[-1] + len(data))
+                yield data
+
+        self._add_section(name, "B", compress(), self.codec, block_rows)
+        self.add_array(name + ".blocks", block_offsets)
+
+    def add_strings(self, name, values):
+        column = StringColumnBuilder(os.path.dirname(self.index_file))
+        for value in values:
+            column.append(value)
+        column.write_to(self, name)
+
+    def commit(self):
+        self._pad()
+        footer = json.dumps({"byteorder": sys.byteorder,
+                             "meta": self.meta,
+                             "sections": self.sections}).encode("utf-8")
+        self.outfile.write(footer)
+        self.outfile.write(TRAILER.pack(len(footer), MAGIC))
+        self.outfile.close()
+        os.replace(self.outfile.name, self.index_file)
+
+    def abort(self):
+        self.outfile.close()
+        if os.path.exists(self.outfile.name):
+            os.remove(self.outfile.name)
+
+    # context management (commit on success, discard temp file on error)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+# This class accumulates one string column row by row, spooling the utf-8 data
+# to a temporary file (in temp_dir, next to the index it is written to) so that
+# wide columns don't have to be held in memory.
+class StringColumnBuilder:
+
+    def __init__(self, temp_dir=None, max_memory_size=COPY_BUFFER_SIZE):
+        self.offsets = array("Q", [0])
+        self.data = tempfile.SpooledTemporaryFile(max_size=max_memory_size, dir=temp_dir)
+
+    def append(self, value):
+        data = value.encode("utf-8")
+        self.data.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def iter_blocks(self, block_rows):
+        self.data.seek(0)
+        for row in range(0, len(self), block_rows):
+            end = min(row + block_rows, len(self))
+            yield self.data.read(self.offsets[end] - self.offsets[row])
+
+    def write_to(self, writer, name):
+        writer.add_array(name + ".offsets", self.offsets)
+        if writer.codec == "none":
+            writer.add_file(name + ".data", self.data)
+        else:
+            writer.add_blocks(name + ".data", self.iter_blocks(BLOCK_ROWS), BLOCK_ROWS)
+        self.data.close()
+
+
+# Read-only view over a single string column of a memory-mapped index.
+class StringColumn:
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return str(self.data[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+    def find(self, value):
+        """
+        Binary search a column sorted in ascending order, return the first row
+        holding the value or -1.
+        """
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self[mid] < value:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self) and self[low] == value:
+            return low
+        return -1
+
+
+# Read-only view over a string column compressed in blocks, a block is
+# decompressed the first time one of its rows is read and kept by the index.
+class BlockStringColumn(StringColumn):
+
+    def __init__(self, offsets, section):
+        super().__init__(offsets, None)
+        self.section = section
+        self.block_pos = -1
+        self.block_start = 0
+
+    def __getitem__(self, row):
+        block_pos = row // self.section.block_rows
+        if block_pos != self.block_pos:
+            self.data = self.section.block(block_pos)
+            self.block_pos = block_pos
+            self.block_start = self.offsets[block_pos * self.section.block_rows]
+        return str(self.data[self.offsets[row] - self.block_start:
+                             self.offsets[row + 1] - self.block_start], "utf-8")
+
+
+# Compressed section of an index file, made of blocks of block_rows rows that
+# are decompressed on their own.
+class BlockSection:
+
+    def __init__(self, codec, data, block_offsets, block_rows):
+        self.codec = codec
+        self.data = data
+        self.block_offsets = block_offsets
+        self.block_rows = block_rows
+        self.blocks = {}
+
+    def __len__(self):
+        return len(self.block_offsets) - 1
+
+    def block(self, pos):
+        ret = self.blocks.get(pos)
+        if ret is None:
+            ret = decompress_block(self.codec, self.data[self.block_offsets[pos]:
+                                                         self.block_offsets[pos + 1]])
+            self.blocks[pos] = ret
+        return ret
+
+
+# This class memory-maps an index file produced by ColumnarIndexWriter and
+# exposes its sections without copying them, so callers only page in the
+# columns they actually touch. Compressed sections are decompressed block by
+# block, the first time a block is accessed.
+class ColumnarIndex:
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        with open(index_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mm)
+        try:
+            footer_size, magic = TRAILER.unpack(self.buffer[-TRAILER.size:])
+            if magic != MAGIC or self.buffer[:len(MAGIC)] != MAGIC:
+                raise ValueError("bad magic")
+            footer_end = len(self.buffer) - TRAILER.size
+            footer = json.loads(str(self.buffer[footer_end - footer_size:footer_end], "utf-8"))
+        except Exception as e:
+            self.close()
+            raise ValueError(f"Corrupted index file {index_file}: {e}")
+        if footer["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"Index file {index_file} was built with "
+                             f"{footer['byteorder']}-endian byte order")
+        self.meta = footer["meta"]
+        self.sections = footer["sections"]
+        self.block_sections = {}
+
+    def has_section(self, name):
+        return name in self.sections
+
+    def _section(self, name):
+        if name not in self.sections:
+            raise ValueError(f"Unknown section '{name}' in index file {self.index_file}")
+        section = self.sections[name]
+        # files written before section compression have no codec entry
+        return section if len(section) > 3 else section + ["none"]
+
+    def block_section(self, name):
+        if name not in self.block_sections:
+            offset, length, typecode, codec, *block_rows = self._section(name)
+            if block_rows:
+                block_offsets = self.array(name + ".blocks")
+            else:
+                # files written before block compression hold a single block
+                block_offsets, block_rows = [0, length], [sys.maxsize]
+            self.block_sections[name] = BlockSection(codec, self.buffer[offset:offset + length],
+                                                     block_offsets, block_rows[0])
+        return self.block_sections[name]
+
+    def array(self, name):
+        offset, length, typecode, codec = self._section(name)[:4]
+        if codec == "none":
+            return self.buffer[offset:offset + length].cast(typecode)
+        section = self.block_section(name)
+        return memoryview(b"".join(section.block(pos)
+                                   for pos in range(len(section)))).cast(typecode)
+
+    def column(self, name):
+        offsets = self.array(name + ".offsets")
+        if self._section(name + ".data")[3] == "none":
+            return StringColumn(offsets, self.array(name + ".data"))
+        return BlockStringColumn(offsets, self.block_section(name + ".data"))
+
+    def close(self):
+        self.block_sections.clear()
+        try:
+            self.buffer.release()
+            self.mm.close()
+        except BufferError:
+            # column views are still alive, the mapping goes away with them
+            pass
+
+    # context management (inside "with" block)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import os
+
+
+# Exclusive advisory lock on a file next to an index file, held inside a "with"
+# block. flock() locks belong to the open file, so the lock serializes threads
+# of one worker as well as all uwsgi worker processes sharing the index dir,
+# and it is released by the OS if the holder dies. A lock file is only removed
+# by remove_lock_file while it is locked, and a lock taken on a file that got
+# removed meanwhile is taken again on the new file, so removing lock files
+# together with their index files keeps builds single-flight.
+class FileLock:
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.fd = None
+
+    def acquire(self):
+        while True:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if is_same_file(fd, self.lock_file):
+                    self.fd = fd
+                    return
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    # context management (inside "with" block)
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def build_once(index_file, build, *args):
+    """
+    Single-flight build of an index file: when the file doesn't exist yet, the
+    first caller runs build(*args) while holding the lock of the file and
+    concurrent callers wait for it and then reuse the file it committed.
+    Return True if this call built the file.
+    """
+    if os.path.isfile(index_file):
+        return False
+    with FileLock(index_file + ".lock"):
+        if os.path.isfile(index_file):
+            return False
+        build(*args)
+        return True
+
+
+def is_same_file(fd, path):
+    """
+    Tell whether the open file fd is still the file found at path.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fd_stat = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (fd_stat.st_dev, fd_stat.st_ino)
+
+
+def remove_lock_file(lock_file):
+    """
+    Remove a lock file unless it is held by a running build. Return True if
+    the file was removed.
+    """
+    try:
+        fd = os.open(lock_file, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if not is_same_file(fd, lock_file):
+            return False
+        os.remove(lock_file)
+        return True
+    finally:
+        os.close(fd)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+from PanGenomeAPI.FileLock import remove_lock_file
+
+EVICTION_POLICIES = ("lru", "lfu")
+# quota of every index dir when none is configured
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+
+# This class keeps the files of one index directory under a byte quota. Every
+# index file is a cache entry: reads and builds are reported to the manager,
+# which records the access by touching the file's mtime (so the recency order
+# is shared by all worker processes using the directory) and counts hits per
+# file for LFU eviction. When a build takes the directory over its quota, the
+# least recently (lru) or least frequently (lfu, ties broken by recency) used
+# files are removed until it fits again, each with its lock file. Files used in
+# the last min_age seconds are never evicted. Index files are
+# immutable and every search opens the ones it needs separately, so a removed
+# file is simply rebuilt by the next search that needs it.
+class IndexCacheManager:
+
+    def __init__(self, index_dir, max_size=DEFAULT_MAX_SIZE, eviction="lru", min_age=10 * 60,
+                 temp_max_age=60 * 60):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown index cache eviction policy '{eviction}', "
+                             f"please use one of {list(EVICTION_POLICIES)}")
+        self.index_dir = index_dir
+        self.max_size = max_size
+        self.eviction = eviction
+        self.min_age = min_age
+        self.temp_max_age = temp_max_age
+        # hit counts of this process, LFU falls back to recency for the rest
+        self.hit_counts = {}
+        self.counters = {"hits": 0, "builds": 0, "evicted_files": 0, "evicted_bytes": 0,
+                         "temp_files_removed": 0, "temp_bytes_removed": 0}
+        self.lock = threading.Lock()
+
+    def accessed(self, index_file):
+        """
+        Record a read of an existing index file.
+        """
+        self._touch(index_file)
+        with self.lock:
+            self.counters["hits"] += 1
+
+    def added(self, index_file):
+        """
+        Record a newly built index file and evict files if the quota is
+        exceeded.
+        """
+        self._touch(index_file)
+        with self.lock:
+            self.counters["builds"] += 1
+        self.enforce_quota()
+
+    def _touch(self, index_file):
+        name = os.path.basename(index_file)
+        with self.lock:
+            self.hit_counts[name] = self.hit_counts.get(name, 0) + 1
+        try:
+            os.utime(index_file)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self, lock_files=None):
+        entries = []
+        temp_files = []
+        with os.scandir(self.index_dir) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if entry.name.endswith(".lock"):
+                    if lock_files is not None:
+                        lock_files.append(entry)
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    temp_files.append((entry, stat))
+                else:
+                    entries.append((entry, stat))
+        return entries, temp_files
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            # removed by another worker
+            return False
+
+    def collect_garbage(self):
+        """
+        Remove temporary files left behind by index builds that crashed, and
+        the lock files of index files that don't exist. Temp files written to
+        in the last temp_max_age seconds may belong to a running build and are
+        kept.
+        """
+        lock_files = []
+        entries, temp_files = self._entries(lock_files)
+        now = time.time()
+        for entry, stat in temp_files:
+            if now - stat.st_mtime > self.temp_max_age and self._remove(entry.path):
+                with self.lock:
+                    self.counters["temp_files_removed"] += 1
+                    self.counters["temp_bytes_removed"] += stat.st_size
+        names = set(entry.name for entry, _ in entries)
+        for entry in lock_files:
+            if entry.name[:-len(".lock")] not in names:
+                remove_lock_file(entry.path)
+
+    def enforce_quota(self):
+        """
+        Evict index files until the directory fits in max_size bytes (no limit
+        when max_size is 0).
+        """
+        if not self.max_size:
+            return
+        entries, temp_files = self._entries()
+        total_size = sum(stat.st_size for _, stat in entries + temp_files)
+        if total_size <= self.max_size:
+            return
+        now = time.time()
+        with self.lock:
+            if self.eviction == "lfu":
+                entries.sort(key=lambda e: (self.hit_counts.get(e[0].name, 0), e[1].st_mtime))
+            else:
+                entries.sort(key=lambda e: e[1].st_mtime)
+        for entry, stat in entries:
+            if total_size <= self.max_size:
+                break
+            if now - stat.st_mtime < self.min_age:
+                continue
+            if self._remove(entry.path):
+                remove_lock_file(entry.path + ".lock")
+                total_size -= stat.st_size
+                with self.lock:
+                    self.hit_counts.pop(entry.name, None)
+                    self.counters["evicted_files"] += 1
+                    self.counters["evicted_bytes"] += stat.st_size
+
+    def stats(self):
+        """
+        Return the current size of the directory together with the counters
+        of this process.
+        """
+        entries, temp_files = self._entries()
+        with self.lock:
+            ret = dict(self.counters)
+        ret.update({"index_dir": self.index_dir,
+                    "max_size": self.max_size,
+                    "eviction": self.eviction,
+                    "num_files": len(entries),
+                    "total_size": sum(stat.st_size for _, stat in entries),
+                    "num_temp_files": len(temp_files),
+                    "temp_size": sum(stat.st_size for _, stat in temp_files)})
+        return ret
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+
+# Thread-safe in-memory cache holding at most max_size entries, the least
+# recently used entry is evicted first. Entries put with a ttl (in seconds)
+# also expire. Instances are meant to be shared by all requests served by one
+# worker process.
+class LRUCache:
+
+    def __init__(self, max_size):
+        if max_size < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            if key in self.expires and self.expires[key] <= time.monotonic():
+                del self.entries[key]
+                del self.expires[key]
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if ttl is None:
+                self.expires.pop(key, None)
+            else:
+                self.expires[key] = time.monotonic() + ttl
+            while len(self.entries) > self.max_size:
+                evicted, _ = self.entries.popitem(last=False)
+                self.expires.pop(evicted, None)
+
+    def __len__(self):
+        return len(self.entries)
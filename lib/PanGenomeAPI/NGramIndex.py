@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from array import array
+
+import numpy as np
+
+from PanGenomeAPI.ColumnarIndex import ColumnarIndex, ColumnarIndexWriter
+
+NGRAM_SIZE = 3
+# approximate number of characters of a column turned into n-grams at once
+CHUNK_SIZE = 1 << 20
+# bits of one code point in the integer code of an n-gram
+CODE_POINT_BITS = 21
+
+
+def iter_column_chunks(column, chunk_size=CHUNK_SIZE):
+    """
+    Iterate the lower-cased texts of a string column in chunks of consecutive
+    rows holding about chunk_size characters, as (first row, texts) pairs.
+    """
+    begin = 0
+    texts = []
+    num_chars = 0
+    for row in range(len(column)):
+        text = column[row].lower()
+        texts.append(text)
+        num_chars += len(text)
+        if num_chars >= chunk_size:
+            yield begin, texts
+            begin, texts, num_chars = row + 1, [], 0
+    if texts:
+        yield begin, texts
+
+
+def chunk_ngrams(begin, texts, ngram_size=NGRAM_SIZE):
+    """
+    Return the distinct (n-gram code, row) pairs of a chunk of texts, sorted
+    by code and then row. The code of an n-gram packs its code points, so
+    codes sort in the same order as the n-gram strings.
+    """
+    code_points = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"),
+                                dtype=np.uint32)
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    num_grams = len(code_points) - ngram_size + 1
+    if num_grams <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint32)
+    # n-grams never span two rows
+    in_row = rows[:num_grams] == rows[ngram_size - 1:]
+    rows = rows[:num_grams][in_row]
+    # the code points of the chunk are numbered in order, which keeps the
+    # order of the n-grams and usually lets (n-gram, row) fit in one integer
+    alphabet = np.flatnonzero(np.bincount(code_points))
+    if len(alphabet) ** ngram_size * len(texts) < 2 ** 63:
+        letter_of = np.zeros(alphabet[-1] + 1, dtype=np.int64)
+        letter_of[alphabet] = np.arange(len(alphabet))
+        letters = letter_of[code_points]
+        keys = np.zeros(num_grams, dtype=np.int64)
+        for pos in range(ngram_size):
+            keys = keys * len(alphabet) + letters[pos:pos + num_grams]
+        keys, _ = sorted_runs(keys[in_row] * len(texts) + rows)
+        keys, rows = np.divmod(keys, len(texts))
+        codes = np.zeros(len(keys), dtype=np.uint64)
+        for pos in reversed(range(ngram_size)):
+            keys, letter = np.divmod(keys, len(alphabet))
+            codes |= alphabet[letter].astype(np.uint64) << np.uint64(CODE_POINT_BITS * (
+                ngram_size - 1 - pos))
+        return codes, (rows + begin).astype(np.uint32)
+    codes = np.zeros(num_grams, dtype=np.uint64)
+    for pos in range(ngram_size):
+        codes = ((codes << np.uint64(CODE_POINT_BITS))
+                 | code_points[pos:pos + num_grams].astype(np.uint64))
+    codes = codes[in_row]
+    order = np.lexsort((rows, codes))
+    codes, rows = codes[order], rows[order]
+    distinct = np.ones(len(codes), dtype=bool)
+    distinct[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+    return codes[distinct], (rows[distinct] + begin).astype(np.uint32)
+
+
+def sorted_runs(values):
+    """
+    Return the distinct values of an array in ascending order together with
+    their number of occurrences.
+    """
+    values = np.sort(values)
+    if not len(values):
+        return values, np.zeros(0, dtype=np.int64)
+    firsts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    return values[firsts], np.diff(np.r_[firsts, len(values)])
+
+
+def decode_ngram(code, ngram_size=NGRAM_SIZE):
+    mask = (1 << CODE_POINT_BITS) - 1
+    return "".join(chr((code >> (CODE_POINT_BITS * pos)) & mask)
+                   for pos in reversed(range(ngram_size)))
+
+
+def build_column_postings(column, postings_file, ngram_size=NGRAM_SIZE):
+    """
+    Write the posting lists (sorted row ids) of every n-gram of a string
+    column to postings_file one after the other, in n-gram order. The texts
+    are read twice, once to count the rows of every n-gram and once to copy
+    the rows to their place in the memory-mapped file, so only a chunk of
+    n-grams is held in memory at a time. Return the sorted n-gram codes and
+    the offsets of their posting lists.
+    """
+    chunk_codes = []
+    chunk_counts = []
+    for begin, texts in iter_column_chunks(column):
+        codes, _ = chunk_ngrams(begin, texts, ngram_size)
+        codes, counts = sorted_runs(codes)
+        chunk_codes.append(codes)
+        chunk_counts.append(counts)
+    if not sum(len(codes) for codes in chunk_codes):
+        return np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.uint64)
+    chunk_codes = np.concatenate(chunk_codes)
+    order = np.argsort(chunk_codes, kind="stable")
+    chunk_codes, chunk_counts = chunk_codes[order], np.concatenate(chunk_counts)[order]
+    firsts = np.flatnonzero(np.r_[True, chunk_codes[1:] != chunk_codes[:-1]])
+    codes = chunk_codes[firsts]
+    counts = np.add.reduceat(chunk_counts, firsts).astype(np.uint64)
+    del chunk_codes, chunk_counts, order
+    offsets = np.zeros(len(codes) + 1, dtype=np.uint64)
+    np.cumsum(counts, out=offsets[1:])
+    if offsets[-1] == 0:
+        return codes, offsets
+
+    postings = np.memmap(postings_file, dtype=np.uint32, mode="w+", shape=(int(offsets[-1]),))
+    filled = offsets[:-1].copy()
+    for begin, texts in iter_column_chunks(column):
+        chunk, rows = chunk_ngrams(begin, texts, ngram_size)
+        if not len(chunk):
+            continue
+        gram_pos = np.searchsorted(codes, chunk)
+        firsts = np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]])
+        sizes = np.diff(np.r_[firsts, len(chunk)])
+        ranks = np.arange(len(chunk)) - np.repeat(firsts, sizes)
+        postings[filled[gram_pos] + ranks.astype(np.uint64)] = rows
+        filled[gram_pos[firsts]] += sizes.astype(np.uint64)
+    postings.flush()
+    del postings
+    return codes, offsets
+
+
+def build_ngram_index(table, columns, index_file, ngram_size=NGRAM_SIZE):
+    """
+    Build the inverted index (n-gram -> sorted row ids) of every given column
+    of a ColumnarIndex table and save it as a ColumnarIndex file with the
+    sections "<column>.grams" (sorted string column), "<column>.postings.offsets"
+    and "<column>.postings". Only n-grams of exactly ngram_size characters are
+    indexed, shorter ones are found in almost every row anyway.
+    """
+    with ColumnarIndexWriter(index_file) as writer:
+        writer.meta.update({"ngram_size": ngram_size, "columns": columns,
+                            "num_rows": table.meta["num_rows"]})
+        for col in columns:
+            # postings are spooled next to the index, like its temp file
+            fd, postings_file = tempfile.mkstemp(dir=os.path.dirname(index_file),
+                                                 prefix=os.path.basename(index_file) + "_",
+                                                 suffix=".tmp")
+            os.close(fd)
+            try:
+                codes, offsets = build_column_postings(table.column(col), postings_file,
+                                                       ngram_size)
+                writer.add_strings(col + ".grams", (decode_ngram(int(code), ngram_size)
+                                                    for code in codes))
+                writer.add_array(col + ".postings.offsets",
+                                 array("Q", offsets.astype(np.uint64).tobytes()))
+                with open(postings_file, "rb") as postings:
+                    writer.add_file(col + ".postings", postings, "I")
+            finally:
+                os.remove(postings_file)
+
+
+# This class answers substring queries over a table using a persistent n-gram
+# index. A word of ngram_size characters resolves to the union of its posting
+# lists over the columns, a longer word to the rows where one column has all
+# the n-grams of the word, which only yields candidates that still have to be
+# verified against the row text. Shorter words can't use the index at all.
+class NGramIndex:
+
+    def __init__(self, index_file):
+        self.index = ColumnarIndex(index_file)
+        self.ngram_size = self.index.meta["ngram_size"]
+        self.columns = [(self.index.column(col + ".grams"),
+                         self.index.array(col + ".postings.offsets"),
+                         self.index.array(col + ".postings"))
+                        for col in self.index.meta["columns"]]
+
+    def posting(self, column, gram):
+        grams, offsets, postings = column
+        pos = grams.find(gram)
+        if pos < 0:
+            return np.zeros(0, dtype=np.uint32)
+        return np.frombuffer(postings[offsets[pos]:offsets[pos + 1]], dtype=np.uint32)
+
+    def is_indexed(self, word):
+        return len(word) >= self.ngram_size
+
+    def is_exact(self, word):
+        return len(word) == self.ngram_size
+
+    def candidates(self, word):
+        """
+        Return a set of row ids that may contain the lower-cased word, which
+        has to be is_indexed. When is_exact(word) is True every returned row
+        is a real match.
+        """
+        size = self.ngram_size
+        grams = sorted(set(word[pos:pos + size] for pos in range(len(word) - size + 1)))
+        ret = np.zeros(0, dtype=np.uint32)
+        for column in self.columns:
+            rows = None
+            for gram in grams:
+                posting = self.posting(column, gram)
+                rows = posting if rows is None else np.intersect1d(rows, posting,
+                                                                   assume_unique=True)
+                if not len(rows):
+                    break
+            ret = np.union1d(ret, rows)
+        return set(ret.tolist())
+
+    def close(self):
+        self.index.close()
+
+    # context management (inside "with" block)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from PanGenomeAPI.ChecksumCache import is_pinned_ref, user_key
+from PanGenomeAPI.LRUCache import LRUCache
+
+
+# Process-wide map of workspace refs to their object info with metadata (as
+# returned by get_object_info3 with includeMetadata). The info of a pinned ref
+# never changes, so it is cached until evicted, other refs only for ttl
+# seconds. Like ChecksumCache, entries are scoped by user token since the
+# workspace call is what checks that the user can read the object.
+class ObjectInfoCache:
+
+    def __init__(self, max_size=100000, ttl=5 * 60):
+        self.ttl = ttl
+        self.infos = LRUCache(max_size)
+
+    async def get_infos(self, ws, token, refs, batch_size=100):
+        """
+        Return the object infos of the given refs in order. The ones not
+        cached are fetched with get_object_info3 calls of at most batch_size
+        refs, made concurrently on the AsyncWorkspace ws (authenticated with
+        the token).
+        """
+        token_key = user_key(token)
+        ret = [self.infos.get((token_key, ref)) for ref in refs]
+        missing_refs = sorted(set(ref for ref, info in zip(refs, ret) if info is None))
+        if not missing_refs:
+            return ret
+        batches = [missing_refs[pos:pos + batch_size]
+                   for pos in range(0, len(missing_refs), batch_size)]
+        results = await asyncio.gather(*[
+            ws.get_object_info3({"objects": [{"ref": ref} for ref in batch],
+                                 "includeMetadata": 1})
+            for batch in batches])
+        fetched = {}
+        for batch, result in zip(batches, results):
+            for ref, info in zip(batch, result["infos"]):
+                fetched[ref] = info
+                self.infos.put((token_key, ref), info, None if is_pinned_ref(ref) else self.ttl)
+        return [fetched[ref] if info is None else info for ref, info in zip(refs, ret)]
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 #BEGIN_HEADER
 from PanGenomeAPI.PanGenomeIndexer import PanGenomeIndexer
-from PanGenomeAPI.fetch_summary.main import fetch_pangenome_summary
 #END_HEADER
 
 
@@ -299,10 +298,9 @@ class PanGenomeAPI:
         # ctx is the context object
         # return variables are: result
         #BEGIN compute_summary_from_pangenome2
-        result = fetch_pangenome_summary(
-            params["pangenome_ref"],
-            self.config["workspace-url"],
+        result = self.indexer.compute_summary_from_pangenome2(
             ctx["token"],
+            params["pangenome_ref"],
         )
         #END compute_summary_from_pangenome2
 
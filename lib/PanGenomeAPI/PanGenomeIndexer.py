@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
+from contextlib import ExitStack
 
+from PanGenomeAPI.ColumnarIndex import ColumnarIndex, ColumnarIndexWriter, check_codec
+from PanGenomeAPI.FileLock import FileLock
+from PanGenomeAPI.IndexCacheManager import DEFAULT_MAX_SIZE, IndexCacheManager
 from PanGenomeAPI.TableIndexer import TableIndexer
 from PanGenomeAPI.PanGenomeViewer import PanGenomeViewer
+from PanGenomeAPI.StreamingWorkspace import StreamingWorkspace
+from PanGenomeAPI.SummaryCache import SummaryCache
+from PanGenomeAPI.fetch_summary.main import fetch_pangenome_summary
 from installed_clients.WorkspaceClient import Workspace as Workspace
+from installed_clients.baseclient import configure_session
 
 
 class PanGenomeIndexer:
@@ -14,8 +22,18 @@ class PanGenomeIndexer:
         self.FAMILIES_SUFFIX = '_families'
         self.FUNCTIONS_SUFFIX = '_functions'
         self.COMPARISON_GENOMES_SUFFIX = '_comparison_genomes'
+        self.FEATURE_FUNCTIONS_SUFFIX = '_feature_functions'
 
         self.ws_url = config["workspace-url"]
+        # keep-alive connections to the services, shared by all clients of the worker
+        timeouts = [float(config[key]) if config.get(key) else None
+                    for key in ("ws-connect-timeout", "ws-read-timeout")]
+        configure_session(int(config.get("ws-pool-size") or 10), *timeouts)
+        self.genome_fetch_concurrency = int(config.get("genome-fetch-concurrency") or 8)
+        self.shared_family_mode = config.get("shared-family-mode") or "auto"
+        self.genome_info_batch_size = int(config.get("genome-info-batch-size") or 100)
+        self.genome_info_concurrency = int(config.get("genome-info-concurrency") or 4)
+        self.genome_index_batch_size = int(config.get("genome-index-batch-size") or 50)
 
         self.pangenome_index_dir = config["pangenome-index-dir"]
         if not os.path.isdir(self.pangenome_index_dir):
@@ -23,9 +41,58 @@ class PanGenomeIndexer:
         self.comparison_genome_index_dir = config["comparison-genome-index-dir"]
         if not os.path.isdir(self.comparison_genome_index_dir):
             os.makedirs(self.comparison_genome_index_dir)
+        self.genome_index_dir = config.get("genome-index-dir", os.path.join(
+            os.path.dirname(os.path.abspath(self.pangenome_index_dir)), "genome_index"))
+        if not os.path.isdir(self.genome_index_dir):
+            os.makedirs(self.genome_index_dir)
+        self.summary_cache_dir = config.get("summary-cache-dir", os.path.join(
+            os.path.dirname(os.path.abspath(self.pangenome_index_dir)), "summary_cache"))
+        if not os.path.isdir(self.summary_cache_dir):
+            os.makedirs(self.summary_cache_dir)
+
+        self.index_compression = config.get("index-compression") or "none"
+        self.index_compression_level = None
+        if config.get("index-compression-level"):
+            self.index_compression_level = int(config["index-compression-level"])
+        check_codec(self.index_compression, self.index_compression_level)
+
+        # every index dir is kept under the same byte quota (0 means unlimited),
+        # files left over by crashed builds are cleaned up at startup and the
+        # resulting sizes are logged
+        index_cache_max_size = int(config.get("index-cache-max-size") or DEFAULT_MAX_SIZE)
+        index_cache_eviction = config.get("index-cache-eviction") or "lru"
+        self.index_caches = {}
+        for index_dir in (self.pangenome_index_dir, self.comparison_genome_index_dir,
+                          self.genome_index_dir, self.summary_cache_dir):
+            if index_dir in self.index_caches:
+                continue
+            index_cache = IndexCacheManager(index_dir, index_cache_max_size,
+                                            index_cache_eviction)
+            index_cache.collect_garbage()
+            index_cache.enforce_quota()
+            self.index_caches[index_dir] = index_cache
+        for stats in self.get_index_cache_stats():
+            print(f"Index cache {stats['index_dir']}: {stats['num_files']} files, "
+                  f"{stats['total_size']} of {stats['max_size']} bytes "
+                  f"({stats['evicted_files']} files evicted, "
+                  f"{stats['temp_files_removed']} temp files removed)")
+        # summaries of the most recently viewed pangenomes are also kept in memory
+        self.summary_cache = SummaryCache(self.summary_cache_dir,
+                                          self.index_caches[self.summary_cache_dir],
+                                          int(config.get("summary-cache-size") or 100))
 
         self.debug = "debug" in config and config["debug"] == "1"
 
+    def get_table_indexer(self, token, index_dir):
+        return TableIndexer(token, self.ws_url, self.index_compression,
+                            self.index_compression_level, self.index_caches[index_dir])
+
+    def get_index_cache_stats(self):
+        """
+        Return the size and usage counters of every index directory.
+        """
+        return [index_cache.stats() for index_cache in self.index_caches.values()]
+
     def search_families_from_comparison_genome(self, token, ref,
                                                query, sort_by, start, limit, num_found):
 
@@ -33,15 +100,12 @@ class PanGenomeIndexer:
         info_included = ['core', 'genome_features', 'id', 'type', 'protein_translation',
                          'number_genomes', 'fraction_genomes', 'fraction_consistent_annotations',
                          'most_consistent_role']
-        table_indexer = TableIndexer(token, self.ws_url)
+        table_indexer = self.get_table_indexer(token, self.comparison_genome_index_dir)
 
         ret = table_indexer.run_search(ref, self.comparison_genome_index_dir,
                                        self.FAMILIES_SUFFIX, search_object, info_included,
-                                       query, sort_by, start, limit, num_found, self.debug)
-
-        for family in ret['families']:
-            if family['genome_features']:
-                family['genome_features'] = eval(family['genome_features'])
+                                       query, sort_by, start, limit, num_found, self.debug,
+                                       structured_info=['genome_features'])
 
         return ret
 
@@ -52,15 +116,12 @@ class PanGenomeIndexer:
         info_included = ['core', 'genome_features', 'id', 'reactions', 'subsystem', 'primclass',
                          'subclass', 'number_genomes', 'fraction_genomes',
                          'fraction_consistent_families', 'most_consistent_family']
-        table_indexer = TableIndexer(token, self.ws_url)
+        table_indexer = self.get_table_indexer(token, self.comparison_genome_index_dir)
 
         ret = table_indexer.run_search(ref, self.comparison_genome_index_dir,
                                        self.FUNCTIONS_SUFFIX, search_object, info_included,
-                                       query, sort_by, start, limit, num_found, self.debug)
-
-        for function in ret['functions']:
-            if function['genome_features']:
-                function['genome_features'] = eval(function['genome_features'])
+                                       query, sort_by, start, limit, num_found, self.debug,
+                                       structured_info=['genome_features'])
 
         return ret
 
@@ -70,16 +131,12 @@ class PanGenomeIndexer:
         search_object = 'genomes'
         info_included = ['id', 'genome_ref', 'genome_similarity', 'name', 'taxonomy', 'features',
                          'families', 'functions']
-        table_indexer = TableIndexer(token, self.ws_url)
+        table_indexer = self.get_table_indexer(token, self.comparison_genome_index_dir)
 
         ret = table_indexer.run_search(ref, self.comparison_genome_index_dir,
                                        self.COMPARISON_GENOMES_SUFFIX, search_object, 
                                        info_included, query, sort_by, start, limit, num_found, 
-                                       self.debug)
-
-        for genome in ret['genomes']:
-            if genome['genome_similarity']:
-                genome['genome_similarity'] = eval(genome['genome_similarity'])
+                                       self.debug, structured_info=['genome_similarity'])
 
         return ret
 
@@ -87,45 +144,163 @@ class PanGenomeIndexer:
 
         search_object = 'orthologs'
         info_included = ['id', 'type', 'function', 'md5', 'protein_translation', 'orthologs']
-        table_indexer = TableIndexer(token, self.ws_url)
-
-        ret = table_indexer.run_search(ref, self.pangenome_index_dir,
-                                       self.ORTHOLOGS_SUFFIX, search_object, info_included,
-                                       query, sort_by, start, limit, num_found, self.debug)
+        table_indexer = self.get_table_indexer(token, self.pangenome_index_dir)
 
-        for orthologs in ret['orthologs']:
-            orthologs_string = orthologs['orthologs']
-            if orthologs_string:
-                orthologs['orthologs'] = list(eval(orthologs_string))
-                if not isinstance(orthologs['orthologs'][0], list):
-                    orthologs['orthologs'] = [orthologs['orthologs']]
+        ret = table_indexer.run_search(
+            ref, self.pangenome_index_dir, self.ORTHOLOGS_SUFFIX, search_object,
+            info_included, query, sort_by, start, limit, num_found, self.debug,
+            structured_info=['orthologs', 'ortholog_functions'],
+            prepare_index=lambda orthologs: self.annotate_ortholog_functions(token, ref,
+                                                                             orthologs))
 
-        ws = Workspace(self.ws_url, token=token)
-        genome_feature_function_map = {}
         for orthologs in ret['orthologs']:
-            for orthologs_obj in orthologs['orthologs']:
+            ortholog_functions = orthologs.pop('ortholog_functions') or {}
+            for orthologs_obj in orthologs['orthologs'] or []:
                 gene_id = orthologs_obj[0]
-
-                if gene_id in genome_feature_function_map:
-                    orthologs_obj.append(genome_feature_function_map.get(gene_id))
-                else:
-                    included = ["/features/[*]/function",
-                                "/features/[*]/id"]
-                    object_info = ws.get_objects2({'objects': 
-                                                  [{'ref': orthologs_obj[2],
-                                                   'included': included}]})['data'][0]['data']
-
-                    for feature in object_info['features']:
-                        genome_feature_function_map.update(
-                            {feature.get('id'): feature.get('function')})
-
-                    orthologs_obj.append(genome_feature_function_map.get(gene_id))
+                orthologs_obj.append(ortholog_functions.get(orthologs_obj[2], {}).get(gene_id))
 
         return ret
 
+    def annotate_ortholog_functions(self, token, ref, orthologs):
+        """
+        Index-build stage of the orthologs index: join the genes of every
+        ortholog family against the features of their genomes and store the
+        functions in an 'ortholog_functions' field (genome_ref -> gene id ->
+        function), so searches don't have to fetch them. Families are
+        annotated one at a time as they are streamed in.
+        """
+        ws = Workspace(self.ws_url, token=token)
+        pangenome = ws.get_objects2({'objects': [{'ref': ref, 'included': ['/genome_refs']}]})
+        pangenome = pangenome['data'][0]['data']
+        # the feature indexes stay open until the last family is annotated
+        with ExitStack() as open_indexes:
+            feature_columns = {}
+            try:
+                feature_columns.update(self.get_feature_function_columns(
+                    token, pangenome.get('genome_refs') or [], open_indexes))
+                for ortholog in orthologs:
+                    ortholog['ortholog_functions'] = self.get_ortholog_functions(
+                        token, ortholog, feature_columns, open_indexes)
+                    yield ortholog
+            finally:
+                # an index can only be unmapped once its column views are gone
+                feature_columns.clear()
+
+    def get_ortholog_functions(self, token, ortholog, feature_columns, open_indexes):
+        ortholog_functions = {}
+        for orthologs_obj in ortholog.get('orthologs') or []:
+            genome_ref, gene_id = orthologs_obj[2], orthologs_obj[0]
+            if genome_ref not in feature_columns:
+                feature_columns.update(self.get_feature_function_columns(
+                    token, [genome_ref], open_indexes))
+            feature_ids, functions = feature_columns[genome_ref]
+            row = feature_ids.find(gene_id)
+            function = functions[row] if row >= 0 else ""
+            ortholog_functions.setdefault(genome_ref, {}).update({gene_id: function or None})
+        return ortholog_functions
+
+    def get_feature_function_columns(self, token, genome_refs, open_indexes):
+        """
+        Return the sorted feature id column and the function column of the
+        feature index of every given genome, keyed by genome ref. The indexes
+        are closed when the ExitStack open_indexes is.
+        """
+        feature_columns = {}
+        for genome_ref, index in self.open_feature_function_indexes(token,
+                                                                    genome_refs).items():
+            open_indexes.enter_context(index)
+            feature_columns.update({genome_ref: (index.column("id"), index.column("function"))})
+        return feature_columns
+
+    def open_feature_function_indexes(self, token, genome_refs):
+        """
+        Open the feature index (ColumnarIndex) of every given genome and return
+        them keyed by genome ref, the caller has to close them. Indexes are
+        keyed by the genome's inner checksum, the ones not built yet are built
+        in batches, from one workspace call per batch streamed genome by genome.
+        """
+        genome_refs = sorted(set(genome_refs))
+        if not genome_refs:
+            return {}
+        ws = Workspace(self.ws_url, token=token)
+        checksums = TableIndexer.checksum_cache.get_checksums(ws, token, genome_refs)
+        index_files = {genome_ref: os.path.join(self.genome_index_dir,
+                                                chsum + self.FEATURE_FUNCTIONS_SUFFIX + ".cidx")
+                       for genome_ref, chsum in zip(genome_refs, checksums)}
+        missing_refs = [genome_ref for genome_ref in genome_refs
+                        if not os.path.isfile(index_files[genome_ref])]
+        # built in batches, each one locked only while it is fetched and built
+        missing_files = sorted(set(index_files[genome_ref] for genome_ref in missing_refs))
+        for pos in range(0, len(missing_files), self.genome_index_batch_size):
+            batch_files = missing_files[pos:pos + self.genome_index_batch_size]
+            with ExitStack() as locks:
+                # locks are taken in file name order so that overlapping batches
+                # of concurrent builds can't deadlock, genomes built while
+                # waiting are not fetched again
+                for index_file in batch_files:
+                    locks.enter_context(FileLock(index_file + ".lock"))
+                batch_refs = [genome_ref for genome_ref in missing_refs
+                              if index_files[genome_ref] in batch_files and
+                              not os.path.isfile(index_files[genome_ref])]
+                if batch_refs:
+                    self.build_feature_function_indexes(token, batch_refs, index_files)
+
+        feature_indexes = {}
+        with ExitStack() as opened:
+            for genome_ref in genome_refs:
+                feature_indexes.update({genome_ref: opened.enter_context(
+                    ColumnarIndex(index_files[genome_ref]))})
+            # all opened, the caller closes them from now on
+            opened.pop_all()
+        # reported once all of them are mapped, so evictions can't remove any
+        index_cache = self.index_caches[self.genome_index_dir]
+        for genome_ref in genome_refs:
+            if genome_ref in missing_refs:
+                index_cache.added(index_files[genome_ref])
+            else:
+                index_cache.accessed(index_files[genome_ref])
+
+        return feature_indexes
+
+    def build_feature_function_indexes(self, token, genome_refs, index_files):
+        included = ["/features/[*]/function",
+                    "/features/[*]/id"]
+        genomes = StreamingWorkspace(self.ws_url, token=token).iter_objects(
+            [{'ref': genome_ref, 'included': included} for genome_ref in genome_refs])
+        num_built = 0
+        for genome_ref, genome in zip(genome_refs, genomes):
+            self.save_feature_function_index(genome['features'], index_files[genome_ref])
+            num_built += 1
+        if num_built < len(genome_refs):
+            raise ValueError(f"Workspace returned {num_built} of the {len(genome_refs)} "
+                             f"requested genomes")
+
+    def save_feature_function_index(self, features, index_file):
+        functions = {}
+        for feature in features:
+            functions.update({feature.get('id'): feature.get('function') or ""})
+        feature_ids = sorted(feature_id for feature_id in functions if feature_id is not None)
+        with ColumnarIndexWriter(index_file) as writer:
+            writer.meta.update({"columns": ["id", "function"], "num_rows": len(feature_ids)})
+            writer.add_strings("id", feature_ids)
+            writer.add_strings("function", (functions[feature_id] for feature_id in feature_ids))
+
     def compute_summary_from_pangenome(self, token, ref):
 
-        pangenome_viewer = PanGenomeViewer(ref, token, self.ws_url)
+        pangenome_viewer = PanGenomeViewer(ref, token, self.ws_url,
+                                           self.genome_fetch_concurrency)
         ret = pangenome_viewer.compute_summary()
 
         return ret
+
+    def compute_summary_from_pangenome2(self, token, ref):
+        """
+        Return the summary of fetch_pangenome_summary for the pangenome, from
+        the summary cache when the same object version was summarized before.
+        """
+        ws = Workspace(self.ws_url, token=token)
+        inner_chsum = TableIndexer.checksum_cache.get_checksum(ws, token, ref)
+        return self.summary_cache.get_summary(inner_chsum, fetch_pangenome_summary, ref,
+                                              self.ws_url, token, self.shared_family_mode,
+                                              self.genome_info_batch_size,
+                                              self.genome_info_concurrency)
@@ -1,8 +1,9 @@
-import multiprocessing
-
-from pathos.multiprocessing import ProcessingPool as Pool
+import asyncio
+from collections import Counter
 
 from installed_clients.WorkspaceClient import Workspace as Workspace
+from PanGenomeAPI.AsyncExecutor import async_executor
+from PanGenomeAPI.AsyncWorkspace import AsyncWorkspace
 
 
 class PanGenomeViewer:
@@ -17,7 +18,6 @@ class PanGenomeViewer:
 
         orthologs = object_info.get('orthologs')
         genome_refs = object_info.get('genome_refs')
-        shared_family_map = self._init_shared_family_map(genome_refs)
 
         family_map = {}
         gene_map = {}
@@ -40,39 +40,50 @@ class PanGenomeViewer:
                 ortholog_gene_map.update({id: gene_ids})
 
         return (pangenome_id, genome_refs, family_map, gene_map, 
-                gene_ortholog_map, ortholog_gene_map, shared_family_map)
-
-    def _init_shared_family_map(self, genome_refs):
-        init_map = {genome_ref: 0 for genome_ref in genome_refs}
-        shared_family_map = {}
-        for genome_ref in genome_refs:
-            shared_family_map.update({genome_ref: init_map})
-
-        return shared_family_map
-
-    def _process_shared_family_map(self, shared_family_genome_refs, shared_family_map):
-        for shared_family_genome_ref in shared_family_genome_refs:
-            shared_family_genome_map = shared_family_map.get(shared_family_genome_ref).copy()
-            for shared_family_genome_ref_copy in shared_family_genome_refs:
-                if shared_family_genome_ref_copy != shared_family_genome_ref:
-                    shared_family_genome_map[shared_family_genome_ref_copy] += 1
-            shared_family_map.update({shared_family_genome_ref: shared_family_genome_map})
+                gene_ortholog_map, ortholog_gene_map)
+
+    def _compute_shared_family_matrix(self, genome_refs, ortholog_gene_map, gene_genome_map):
+        """
+        Count the homolog families shared by every pair of genomes: entry
+        [i][j] of the returned matrix is the number of families with genes in
+        both genome_refs[i] and genome_refs[j] (the diagonal counts the
+        families of each genome).
+        """
+        genome_index = {genome_ref: pos for pos, genome_ref in enumerate(genome_refs)}
+        # families found in the same genomes (the core ones above all) are
+        # added to the matrix together
+        family_genome_counts = Counter(
+            frozenset(genome_index[gene_genome_map[gene_id]] for gene_id in gene_ids
+                      if gene_id in gene_genome_map)
+            for gene_ids in ortholog_gene_map.values())
+        shared_family_matrix = [[0] * len(genome_refs) for genome_ref in genome_refs]
+        for family_genomes, count in family_genome_counts.items():
+            for genome_pos in family_genomes:
+                row = shared_family_matrix[genome_pos]
+                for other_genome_pos in family_genomes:
+                    row[other_genome_pos] += count
+
+        return shared_family_matrix
+
+    async def _fetch_genome(self, ws, genome_ref):
+        # only the fields used by _process_genome, not sequences or translations
+        included = ['/scientific_name', '/id', '/features/[*]/id']
+        try:
+            object_info = (await ws.get_objects2(
+                {'objects': [{'ref': genome_ref, 'included': included}]}
+            ))['data'][0]['data']
+        except Exception as e:
+            raise RuntimeError("Error in accessing WS objects: %s" % e)
 
-        return shared_family_map
+        return object_info
 
-    def _process_genome(self, genome_ref, gene_map, gene_ortholog_map):
+    def _process_genome(self, genome_ref, object_info, gene_map, gene_ortholog_map):
 
         gene_genome_map = {}
         genome_ref_name_map = {}
 
         genome_gene_map = {}
         ortholog_ids = []
-        try:
-            object_info = self.ws.get_objects2(
-                {'objects': [{'ref': genome_ref}]}
-            )['data'][0]['data']
-        except Exception as e:
-            raise RuntimeError("Error in accessing WS objects: %s" % e)
 
         scientific_name = object_info.get('scientific_name')
         if scientific_name:
@@ -111,13 +122,8 @@ class PanGenomeViewer:
         genome_map = {} 
         genome_ortholog_map = {}
 
-        arg_2 = [gene_map] * len(genome_refs)
-        arg_3 = [gene_ortholog_map] * len(genome_refs)
-
-        cpus = min(8, multiprocessing.cpu_count())
-        pool = Pool(ncpus=cpus)
-        process_genome_returns = pool.map(self._process_genome, 
-                                          genome_refs, arg_2, arg_3)
+        process_genome_returns = async_executor.run(
+            self._process_genomes_async(genome_refs, gene_map, gene_ortholog_map))
 
         for process_genome_return in process_genome_returns:
             genome_ref_name_map.update(process_genome_return['genome_ref_name_map'])
@@ -141,9 +147,23 @@ class PanGenomeViewer:
 
         return genome_ref_name_map, gene_genome_map, genome_map, genome_ortholog_map
 
+    async def _process_genomes_async(self, genome_refs, gene_map, gene_ortholog_map):
+        # genomes are downloaded concurrently and each one is processed as
+        # soon as it arrives, all of them reading the same gene maps
+        async with AsyncWorkspace(self.ws_url, token=self.token,
+                                  max_concurrency=self.max_concurrency) as ws:
+
+            async def process_genome(genome_ref):
+                object_info = await self._fetch_genome(ws, genome_ref)
+                return self._process_genome(genome_ref, object_info, gene_map,
+                                            gene_ortholog_map)
+
+            return await asyncio.gather(*[process_genome(genome_ref)
+                                          for genome_ref in genome_refs])
+
     def _compute_result_map(self, pangenome_id, genome_map, gene_map, family_map,
                             genome_ortholog_map, genome_ref_name_map, ortholog_gene_map,
-                            gene_genome_map, shared_family_map):
+                            gene_genome_map):
         result = {}
 
         # Pan-genome object ID
@@ -188,25 +208,17 @@ class PanGenomeViewer:
                         'genome_singleton_family_genes': genome_genes - genome_homolog_family_genes
                         }})
 
-        #  Shared homolog familes
-        for ortholog_id, gene_ids in ortholog_gene_map.items():
-            shared_family_genome_refs = []
-            for gene_id in list(set(gene_ids)):
-                shared_family_genome_refs.append(gene_genome_map.get(gene_id))
-                shared_family_genome_refs = [i for i in shared_family_genome_refs if i is not None]
-            shared_family_map = self._process_shared_family_map(list(set(shared_family_genome_refs)), 
-                                                                shared_family_map)
-
-        for genome_ref, genome_family_map in shared_family_map.items():
-            genome_name = genome_ref_name_map.get(genome_ref)
-            genome_family_map[genome_ref] = result['genomes'][genome_name]['genome_homolog_family']
-
-            for genome_ref, genome_name in genome_ref_name_map.items():
-                if genome_ref in genome_family_map:
-                    genome_family_map[genome_name] = genome_family_map.pop(genome_ref)
-
-        for genome_ref, genome_name in genome_ref_name_map.items():
-            shared_family_map[genome_name] = shared_family_map.pop(genome_ref)
+        #  Shared homolog familes (genome name -> genome name -> # of families),
+        #  a genome's own entry is its number of homolog families
+        genome_refs = list(genome_map)
+        genome_names = [genome_ref_name_map.get(genome_ref) for genome_ref in genome_refs]
+        shared_family_matrix = self._compute_shared_family_matrix(genome_refs, ortholog_gene_map,
+                                                                  gene_genome_map)
+        shared_family_map = {}
+        for genome_pos, genome_name in enumerate(genome_names):
+            row = shared_family_matrix[genome_pos]
+            row[genome_pos] = result['genomes'][genome_name]['genome_homolog_family']
+            shared_family_map.update({genome_name: dict(zip(genome_names, row))})
 
         result.update({'shared_family_map': shared_family_map})
 
@@ -215,15 +227,19 @@ class PanGenomeViewer:
 
         return result
 
-    def __init__(self, pangenome_ref, token, ws_url):
+    def __init__(self, pangenome_ref, token, ws_url, max_concurrency=8):
         self.pangenome_ref = pangenome_ref
+        self.token = token
+        self.ws_url = ws_url
+        # number of genomes downloaded at once
+        self.max_concurrency = max_concurrency
         self.ws = Workspace(ws_url, token=token)
 
     def compute_summary(self):
 
         (pangenome_id, genome_refs, family_map, 
-         gene_map, gene_ortholog_map, ortholog_gene_map, 
-         shared_family_map) = self._process_pangenome(self.pangenome_ref)
+         gene_map, gene_ortholog_map, ortholog_gene_map) = self._process_pangenome(
+            self.pangenome_ref)
 
         (genome_ref_name_map, gene_genome_map, 
          genome_map, genome_ortholog_map) = self._process_genomes(genome_refs, 
@@ -232,6 +248,6 @@ class PanGenomeViewer:
 
         ret = self._compute_result_map(pangenome_id, genome_map, gene_map, family_map,
                                        genome_ortholog_map, genome_ref_name_map, ortholog_gene_map,
-                                       gene_genome_map, shared_family_map)
+                                       gene_genome_map)
 
         return ret
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import heapq
+from array import array
+
+from PanGenomeAPI.ColumnarIndex import ColumnarIndex, ColumnarIndexWriter
+
+
+# Sort key of a whole row, used the way sort(1) does its last-resort comparison
+# when all the requested keys are equal: rows are compared by their complete
+# tab-separated text. The text is only built when two rows actually tie.
+class LineKey:
+
+    __slots__ = ("row", "columns", "text")
+
+    def __init__(self, row, columns):
+        self.row = row
+        self.columns = columns
+        self.text = None
+
+    def get_text(self):
+        if self.text is None:
+            self.text = "\t".join(column[self.row] for column in self.columns)
+        return self.text
+
+    def __lt__(self, other):
+        text, other_text = self.get_text(), other.get_text()
+        return text < other_text or (text == other_text and self.row < other.row)
+
+    def __eq__(self, other):
+        return self.row == other.row
+
+
+def build_sort_index(column, line_columns, index_file):
+    """
+    Sort a string column the way "sort -f -kN,N" and "sort -f -kN,Nr" do and
+    save the result as a ColumnarIndex file with the sections "ranks" (dense
+    rank of every row in the case-folded order, equal values share a rank),
+    "case_ranks" (the same in the case-sensitive order), "ascending" and
+    "descending" (row permutations). A key with its own "r" option doesn't
+    inherit the global "-f", so only the ascending order is case-folded. Ties
+    are ordered by the whole row in both orders, see LineKey.
+    """
+    num_rows = len(column)
+    ranks = dense_ranks([column[row].upper() for row in range(num_rows)])
+    ascending = array("I", sorted(range(num_rows),
+                                  key=lambda row: (ranks[row], LineKey(row, line_columns))))
+    case_ranks = dense_ranks([column[row] for row in range(num_rows)])
+    descending = array("I", sorted(range(num_rows), key=lambda row: (
+        -case_ranks[row], LineKey(row, line_columns))))
+    with ColumnarIndexWriter(index_file) as writer:
+        writer.meta.update({"num_rows": num_rows})
+        writer.add_array("ranks", ranks)
+        writer.add_array("case_ranks", case_ranks)
+        writer.add_array("ascending", ascending)
+        writer.add_array("descending", descending)
+
+
+def dense_ranks(keys):
+    """
+    Return the rank of every key among the distinct keys, as an array.
+    """
+    rank_of = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+    return array("I", (rank_of[key] for key in keys))
+
+
+# Memory-mapped view over the ranks and permutations of one sorted column.
+class SortIndex:
+
+    def __init__(self, index_file):
+        self.index = ColumnarIndex(index_file)
+        self.ranks = self.index.array("ranks")
+        self.case_ranks = self.index.array("case_ranks")
+
+    def permutation(self, ascending):
+        return self.index.array("ascending" if ascending else "descending")
+
+    def close(self):
+        self.index.close()
+
+
+# Inverts the ordering of a value that can't simply be negated (column text).
+class DescendingKey:
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+# This class composes the sort columns of a sort_by list into one row ordering.
+# A sort column is either a SortIndex (ranks stored on disk) or a plain string
+# column that hasn't been sorted yet. Nothing is sorted up front: a single
+# stored column is streamed from its permutation, and any other order is built
+# only for the rows that are asked for, with a bounded heap when just the first
+# rows of the order are needed.
+class RowOrder:
+
+    def __init__(self, num_rows, line_columns, sort_columns=(), ascending=()):
+        self.num_rows = num_rows
+        self.line_columns = line_columns
+        self.sort_columns = list(sort_columns)
+        self.ascending = list(ascending)
+        self.key = self.build_key()
+
+    def build_column_key(self, sort_column, ascending):
+        # descending keys are case-sensitive, see build_sort_index
+        if isinstance(sort_column, SortIndex):
+            if ascending:
+                return sort_column.ranks.__getitem__
+            case_ranks = sort_column.case_ranks
+            return lambda row: -case_ranks[row]
+        if ascending:
+            return lambda row: sort_column[row].upper()
+        return lambda row: DescendingKey(sort_column[row])
+
+    def build_key(self):
+        if not self.sort_columns:
+            return None
+        column_keys = [self.build_column_key(sort_column, ascending)
+                       for sort_column, ascending in zip(self.sort_columns, self.ascending)]
+        line_columns = self.line_columns
+        if len(column_keys) == 1:
+            column_key, = column_keys
+            return lambda row: (column_key(row), LineKey(row, line_columns))
+        return lambda row: tuple(column_key(row) for column_key in column_keys) + (
+            LineKey(row, line_columns),)
+
+    def has_stored_order(self):
+        """
+        Tell whether the order of all rows is available without sorting.
+        """
+        return not self.sort_columns or (len(self.sort_columns) == 1 and
+                                         isinstance(self.sort_columns[0], SortIndex))
+
+    def rows(self, subset=None, max_rows=None):
+        """
+        Return the row ids (all rows, or only those of the subset) in order as
+        a sequence. When max_rows is set only the first max_rows of them are
+        guaranteed.
+        """
+        if subset is None and self.has_stored_order():
+            if not self.sort_columns:
+                return range(self.num_rows)
+            return self.sort_columns[0].permutation(self.ascending[0])
+        if subset is None:
+            subset = range(self.num_rows)
+        if max_rows is not None and max_rows < len(subset):
+            return heapq.nsmallest(max_rows, subset, key=self.key)
+        return sorted(subset, key=self.key)
+
+    def iter_rows(self, subset):
+        """
+        Lazily iterate the rows of the subset in order, each row costs a heap
+        pop so stopping early saves sorting the rest of the subset.
+        """
+        if self.key is None:
+            heap = list(subset)
+            heapq.heapify(heap)
+            while heap:
+                yield heapq.heappop(heap)
+        else:
+            # keys end with the LineKey of the row
+            heap = [self.key(row) for row in subset]
+            heapq.heapify(heap)
+            while heap:
+                yield heapq.heappop(heap)[-1].row
+
+    def close(self):
+        for sort_column in self.sort_columns:
+            if isinstance(sort_column, SortIndex):
+                sort_column.close()
+
+    # context management (inside "with" block)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
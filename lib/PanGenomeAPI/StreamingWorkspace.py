@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+
+import ijson
+
+from installed_clients.baseclient import ServerError, get_session, get_timeout
+
+
+# This class calls Workspace.get_objects2 and parses the HTTP response body
+# incrementally with an event-based JSON parser, yielding objects (or the items
+# of one list field of an object) as soon as they have been received instead of
+# materializing the whole response. Memory use is bounded by the size of one
+# yielded value.
+class StreamingWorkspace:
+
+    def __init__(self, url, token=None, timeout=30 * 60, chunk_size=1 << 16):
+        self.url = url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.headers = {}
+        if token is not None:
+            self.headers['AUTHORIZATION'] = token
+
+    def iter_objects(self, objects):
+        """
+        Yield the data of every requested object specification in turn.
+        """
+        for object_data in self._iter_result_items(objects, 'result.item.data.item'):
+            yield object_data['data']
+
+    def iter_object_items(self, ref, field, included=None):
+        """
+        Yield the items of the list stored in the given top level field of a
+        single object.
+        """
+        object_spec = {'ref': ref}
+        if included is not None:
+            object_spec['included'] = included
+        # result[0].data[0].data.<field>[*]
+        yield from self._iter_result_items([object_spec],
+                                           'result.item.data.item.data.' + field + '.item')
+
+    def _iter_result_items(self, objects, prefix):
+        body = json.dumps({'method': 'Workspace.get_objects2',
+                           'params': [{'objects': objects}],
+                           'version': '1.1',
+                           'id': str(random.random())[2:]})
+        with get_session().post(self.url, data=body, headers=self.headers,
+                                timeout=get_timeout(self.timeout), stream=True) as ret:
+            if ret.status_code == 500:
+                ret.encoding = 'utf-8'
+                if ret.headers.get('content-type') == 'application/json':
+                    err = ret.json()
+                    if 'error' in err:
+                        raise ServerError(**err['error'])
+                raise ServerError('Unknown', 0, ret.text)
+            if not ret.ok:
+                ret.raise_for_status()
+            ret.raw.decode_content = True
+            events = ijson.parse(ret.raw, use_float=True, buf_size=self.chunk_size)
+            yield from ijson.items(self._check_events(events, prefix), prefix)
+
+    @staticmethod
+    def _check_events(events, prefix):
+        """
+        Pass the parser events through, then raise ServerError if the response
+        held a JSON-RPC error or lacked the list of the yielded items, so that
+        a failed call is never taken for an empty list.
+        """
+        items_list = prefix.rsplit('.', 1)[0]
+        has_list = False
+        error = None
+        for path, event, value in events:
+            if path == items_list and event == 'start_array':
+                has_list = True
+            elif path == 'error' or path.startswith('error.'):
+                if error is None:
+                    error = ijson.ObjectBuilder()
+                error.event(event, value)
+            yield path, event, value
+        if error is not None and error.value is not None:
+            raise ServerError(**error.value)
+        if not has_list:
+            raise ServerError('Unknown', 0, f"No '{items_list}' list in the "
+                                            f"Workspace.get_objects2 response")
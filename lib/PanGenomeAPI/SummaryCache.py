@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import tempfile
+
+from PanGenomeAPI.FileLock import build_once
+from PanGenomeAPI.LRUCache import LRUCache
+
+
+# Two level cache of pangenome summaries keyed by the inner checksum of the
+# pangenome object. A summary only depends on the immutable object version, so
+# it is computed once, saved as gzipped JSON in the cache dir (shared by all
+# worker processes, single-flight like the index files) and then served from
+# the in-memory LRU front of each worker. Summary files are entries of the
+# dir's index cache, so they are kept under the same quota and eviction policy
+# as the index files.
+class SummaryCache:
+
+    def __init__(self, cache_dir, index_cache=None, max_size=100):
+        self.cache_dir = cache_dir
+        self.index_cache = index_cache
+        self.summaries = LRUCache(max_size)
+
+    def get_summary(self, inner_chsum, compute, *args):
+        """
+        Return the summary of the object with the given inner checksum,
+        computed with compute(*args) if it is neither in memory nor on disk.
+        """
+        ret = self.summaries.get(inner_chsum)
+        if ret is not None:
+            return ret
+        summary_file = self.get_summary_file(inner_chsum)
+        computed = []
+        built = build_once(summary_file, self.build_summary, summary_file, computed,
+                           compute, *args)
+        ret = computed[0] if built else self.load_summary(summary_file)
+        if self.index_cache is not None:
+            if built:
+                self.index_cache.added(summary_file)
+            else:
+                self.index_cache.accessed(summary_file)
+        self.summaries.put(inner_chsum, ret)
+        return ret
+
+    def get_summary_file(self, inner_chsum):
+        return os.path.join(self.cache_dir, inner_chsum + "_summary.json.gz")
+
+    def build_summary(self, summary_file, computed, compute, *args):
+        computed.append(compute(*args))
+        self.save_summary(computed[0], summary_file)
+
+    def save_summary(self, summary, summary_file):
+        # written to a temp file first so the summary file is never partial
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir,
+                                         prefix=os.path.basename(summary_file) + "_",
+                                         suffix=".tmp", delete=False) as outfile:
+            try:
+                with gzip.GzipFile(fileobj=outfile, mode="wb") as gzfile:
+                    gzfile.write(json.dumps(summary).encode("utf-8"))
+            except BaseException:
+                outfile.close()
+                os.remove(outfile.name)
+                raise
+        os.replace(outfile.name, summary_file)
+
+    def load_summary(self, summary_file):
+        with gzip.open(summary_file, "rb") as infile:
+            return json.loads(infile.read())
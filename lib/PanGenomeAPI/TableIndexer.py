@@ -1,22 +1,42 @@
+import hashlib
+import itertools
+import json
 import os
 import time
-import tempfile
-import subprocess
 import traceback
+from array import array
 
 from installed_clients.WorkspaceClient import Workspace as Workspace
-from PanGenomeAPI.CombinedLineIterator import CombinedLineIterator
+from PanGenomeAPI.LRUCache import LRUCache
+from PanGenomeAPI.ChecksumCache import ChecksumCache
+from PanGenomeAPI.ColumnarIndex import ColumnarIndex, ColumnarIndexWriter, StringColumnBuilder
+from PanGenomeAPI.FileLock import build_once
+from PanGenomeAPI.NGramIndex import NGRAM_SIZE, NGramIndex, build_ngram_index
+from PanGenomeAPI.SortIndex import RowOrder, SortIndex, build_sort_index
+from PanGenomeAPI.StreamingWorkspace import StreamingWorkspace
 
 
 class TableIndexer:
 
-    def __init__(self, token, ws_url):
+    # (inner checksum + object suffix, normalized query words) -> num_found,
+    # shared by all searches of the worker process
+    num_found_cache = LRUCache(10000)
+    # (user, object ref) -> inner checksum, lets warm searches skip the workspace
+    checksum_cache = ChecksumCache()
+
+    def __init__(self, token, ws_url, compression="none", compression_level=None,
+                 index_cache=None):
         self.token = token
         self.ws_url = ws_url
-        self.max_sort_mem_size = 250000
+        self.compression = compression
+        self.compression_level = compression_level
+        # IndexCacheManager of the index dir, told about every index file used
+        self.index_cache = index_cache
+        self.max_top_k_size = 10000
 
     def run_search(self, ref, index_dir, object_suffix, search_object, info_included,
-                   query, sort_by, start, limit, num_found, debug):
+                   query, sort_by, start, limit, num_found, debug, structured_info=(),
+                   prepare_index=None):
 
         self.object_column_props_map = self.build_object_column_props_map(info_included)
 
@@ -33,10 +53,17 @@ class TableIndexer:
             t1 = time.time()
 
         inner_chsum = self.check_object_cache(ref, search_object, info_included,
+                                              structured_info, prepare_index,
                                               index_dir, object_suffix, debug)
-        index_iter = self.get_object_sorted_iterator(inner_chsum, sort_by,
+        index_iter = self.get_object_sorted_iterator(inner_chsum, sort_by, start + limit,
                                                      index_dir, object_suffix, debug)
-        ret = self.filter_obejct_query(query, index_iter, search_object, info_included,
+        query_index_file = self.get_index_file(inner_chsum, index_dir, object_suffix, "grams")
+        result_code = self.get_result_code(self.object_column_props_map, query, sort_by)
+        result_file = self.get_index_file(inner_chsum, index_dir,
+                                          object_suffix + "_" + result_code, "rows")
+        query_key = (inner_chsum + object_suffix, self.get_query_key(query))
+        ret = self.filter_obejct_query(query, index_iter, query_index_file, result_file,
+                                       query_key, search_object, info_included, structured_info,
                                        limit, start, num_found, debug)
 
         if debug:
@@ -44,27 +71,62 @@ class TableIndexer:
 
         return ret
 
-    def check_object_cache(self, ref, search_object, info_included,
-                           index_dir, object_suffix, debug):
+    def check_object_cache(self, ref, search_object, info_included, structured_info,
+                           prepare_index, index_dir, object_suffix, debug):
         ws = Workspace(self.ws_url, token=self.token)
-        info = ws.get_object_info3({"objects": [{"ref": ref}]})['infos'][0]
-        inner_chsum = info[8]
-        index_file = os.path.join(index_dir,
-                                  inner_chsum + object_suffix + ".tsv.gz")
-        if not os.path.isfile(index_file):
-            if debug:
-                print("    Loading WS object...")
-                t1 = time.time()
-
-            included = self.build_info_included(search_object, info_included)
-            object = ws.get_objects2({'objects': [{'ref': ref,
-                                                   'included': included}]})['data'][0]['data']
-            self.save_object_tsv(object[search_object], inner_chsum, info_included,
-                                 index_dir, object_suffix)
-            if debug:
-                print("    (time=" + str(time.time() - t1) + ")")
+        inner_chsum = self.checksum_cache.get_checksum(ws, self.token, ref)
+        # concurrent searches of a new object wait for the first one to build
+        # its indexes instead of downloading and indexing it again
+        index_file = self.get_index_file(inner_chsum, index_dir, object_suffix)
+        self.ensure_index_file(index_file, self.build_object_index, ref, search_object,
+                               info_included, structured_info, prepare_index, inner_chsum,
+                               index_dir, object_suffix, debug)
         return inner_chsum
 
+    def ensure_index_file(self, index_file, build, *args):
+        """
+        Build the index file with build(*args) unless it already exists (see
+        build_once) and report its use to the index cache.
+        """
+        self.track_index_file(index_file, build_once(index_file, build, *args))
+
+    def track_index_file(self, index_file, built=False):
+        if self.index_cache is None:
+            return
+        if built:
+            self.index_cache.added(index_file)
+        else:
+            self.index_cache.accessed(index_file)
+
+    def build_object_index(self, ref, search_object, info_included, structured_info,
+                           prepare_index, inner_chsum, index_dir, object_suffix, debug):
+        if debug:
+            print("    Loading WS object...")
+            t1 = time.time()
+
+        # rows are written to the index as they are parsed from the response
+        included = self.build_info_included(search_object, info_included)
+        stream_ws = StreamingWorkspace(self.ws_url, token=self.token)
+        search_object_infos = stream_ws.iter_object_items(ref, search_object, included)
+        if prepare_index:
+            # lets the caller add structured columns computed at build time
+            search_object_infos = prepare_index(search_object_infos)
+        self.save_object_index(search_object_infos, inner_chsum, info_included,
+                               structured_info, index_dir, object_suffix)
+        if debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+
+    def build_query_index(self, index, info_included, query_index_file, debug):
+        if debug:
+            print("    Building query index...")
+            t1 = time.time()
+        build_ngram_index(index, info_included, query_index_file)
+        if debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+
+    def get_index_file(self, inner_chsum, index_dir, object_suffix, extension="cidx"):
+        return os.path.join(index_dir, inner_chsum + object_suffix + "." + extension)
+
     def build_info_included(self, search_object, info_included):
 
         included = []
@@ -74,28 +136,28 @@ class TableIndexer:
 
         return included
 
-    def save_object_tsv(self, search_object_infos, inner_chsum, info_included,
-                        index_dir, object_suffix):
-        outfile = tempfile.NamedTemporaryFile(dir=index_dir,
-                                              prefix=inner_chsum + object_suffix,
-                                              suffix=".tsv", delete=False)
-        with outfile:
-            for search_object_info in search_object_infos:
-
-                line = ""
-
-                for info in info_included:
-                    object_info = self.to_text(search_object_info, info)
-                    line += object_info + "\t"
-
-                line = line[:-1] + "\n"
-                outfile.write(line.encode("utf-8"))
-
-        subprocess.Popen(["gzip", outfile.name],
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE).wait()
-        os.rename(outfile.name + ".gz",
-                  os.path.join(index_dir,
-                               inner_chsum + object_suffix + ".tsv.gz"))
+    def save_object_index(self, search_object_infos, inner_chsum, info_included,
+                          structured_info, index_dir, object_suffix):
+        # searchable text of every column, plus a JSON encoding of the nested
+        # values of the structured columns that is decoded for returned rows
+        columns = [StringColumnBuilder(index_dir) for info in info_included]
+        encoded_columns = [StringColumnBuilder(index_dir) for info in structured_info]
+        for search_object_info in search_object_infos:
+            for info, column in zip(info_included, columns):
+                column.append(self.to_text(search_object_info, info))
+            for info, column in zip(structured_info, encoded_columns):
+                column.append(self.to_json(search_object_info, info))
+
+        index_file = self.get_index_file(inner_chsum, index_dir, object_suffix)
+        with ColumnarIndexWriter(index_file, self.compression,
+                                 self.compression_level) as writer:
+            writer.meta.update({"columns": info_included,
+                                "structured_columns": structured_info,
+                                "num_rows": len(columns[0]) if columns else 0})
+            for info, column in zip(info_included, columns):
+                column.write_to(writer, info)
+            for info, column in zip(structured_info, encoded_columns):
+                column.write_to(writer, info + ".json")
 
     def to_text(self, mapping, key):
         if key not in mapping or mapping[key] is None:
@@ -105,55 +167,54 @@ class TableIndexer:
             return ",".join(str(x) for x in value if x)
         return str(value)
 
-    def get_object_sorted_iterator(self, inner_chsum, sort_by, index_dir, object_suffix, debug):
-        return self.get_sorted_iterator(inner_chsum, sort_by, object_suffix,
+    def to_json(self, mapping, key):
+        if key not in mapping or mapping[key] is None:
+            return ""
+        value = mapping[key]
+        if type(value) is list:
+            # same items as to_text keeps
+            value = [x for x in value if x]
+        return json.dumps(value, separators=(",", ":"))
+
+    def get_object_sorted_iterator(self, inner_chsum, sort_by, max_rows, index_dir,
+                                   object_suffix, debug):
+        return self.get_sorted_iterator(inner_chsum, sort_by, max_rows, object_suffix,
                                         self.object_column_props_map,
                                         index_dir, debug)
 
-    def get_sorted_iterator(self, inner_chsum, sort_by, item_type, column_props_map,
+    def get_sorted_iterator(self, inner_chsum, sort_by, max_rows, item_type, column_props_map,
                             index_dir, debug):
-        input_file = os.path.join(index_dir, inner_chsum + item_type + ".tsv.gz")
+        input_file = self.get_index_file(inner_chsum, index_dir, item_type)
         if not os.path.isfile(input_file):
             raise ValueError("File not found: " + input_file)
-        if sort_by is None or len(sort_by) == 0:
-            return CombinedLineIterator(input_file)
-        cmd = "gunzip -c \"" + input_file + "\" | sort -f -t\\\t"
-        for column_sorting in sort_by:
+        index = ColumnarIndex(input_file)
+        line_columns = [index.column(col_name) for col_name in index.meta["columns"]]
+        sort_columns = []
+        ascending = []
+        for column_sorting in sort_by or []:
             col_name = column_sorting[0]
             col_props = self.get_column_props(column_props_map, col_name)
-            col_pos = str(col_props["col"])
-            ascending_order = column_sorting[1]
-            sort_arg = "-k" + col_pos + "," + col_pos + col_props["type"]
-            if not ascending_order:
-                sort_arg += "r"
-            cmd += " " + sort_arg
-        fname = (inner_chsum + "_" + item_type + "_" +
-                 self.get_sorting_code(column_props_map, sort_by))
-        final_output_file = os.path.join(index_dir, fname + ".tsv.gz")
-        if not os.path.isfile(final_output_file):
-            if debug:
-                print("    Sorting...")
-                t1 = time.time()
-            need_to_save = os.path.getsize(input_file) > self.max_sort_mem_size
-            if need_to_save:
-                outfile = tempfile.NamedTemporaryFile(dir=index_dir,
-                                                      prefix=fname + "_", suffix=".tsv.gz",
-                                                      delete=False)
-                outfile.close()
-                output_file = outfile.name
-                cmd += " | gzip -c > \"" + output_file + "\""
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            if not need_to_save:
-                if debug:
-                    print("    (time=" + str(time.time() - t1) + ")")
-                return CombinedLineIterator(p)
-            else:
-                p.wait()
-                os.rename(output_file, final_output_file)
-                if debug:
-                    print("    (time=" + str(time.time() - t1) + ")")
-        return CombinedLineIterator(final_output_file)
+            sort_file = self.get_index_file(inner_chsum, index_dir,
+                                            item_type + "_" + str(col_props["col"]), "sort")
+            if not os.path.isfile(sort_file) and max_rows <= self.max_top_k_size:
+                # the first rows of the order are picked with a bounded heap,
+                # the column only gets fully sorted once deeper pages are needed
+                sort_columns.append(index.column(col_name))
+                ascending.append(column_sorting[1])
+                continue
+            self.ensure_index_file(sort_file, self.build_sort_file, index.column(col_name),
+                                   line_columns, sort_file, debug)
+            sort_columns.append(SortIndex(sort_file))
+            ascending.append(column_sorting[1])
+        return index, RowOrder(index.meta["num_rows"], line_columns, sort_columns, ascending)
+
+    def build_sort_file(self, column, line_columns, sort_file, debug):
+        if debug:
+            print("    Sorting...")
+            t1 = time.time()
+        build_sort_index(column, line_columns, sort_file)
+        if debug:
+            print("    (time=" + str(time.time() - t1) + ")")
 
     def get_sorting_code(self, column_props_map, sort_by):
         ret = ""
@@ -167,6 +228,14 @@ class TableIndexer:
             ret += col_pos + ('a' if ascending_order else 'd')
         return ret
 
+    def get_query_key(self, query):
+        return tuple(sorted(set(self.get_query_words(query))))
+
+    def get_result_code(self, column_props_map, query, sort_by):
+        query_key = self.get_query_key(query)
+        sorting_code = self.get_sorting_code(column_props_map, sort_by)
+        return hashlib.md5(json.dumps([query_key, sorting_code]).encode("utf-8")).hexdigest()
+
     def get_column_props(self, column_props_map, col_name):
         if col_name not in column_props_map:
             raise ValueError(f"Unknown column name '{col_name}', "
@@ -186,35 +255,119 @@ class TableIndexer:
 
         return object_column_props_map
 
-    def filter_obejct_query(self, query, index_iter, search_object, info_included,
-                            limit, start, num_found, debug):
-        query_words = str(query).lower().translate(str.maketrans("\r\n\t,", "    ")).split()
+    def get_query_words(self, query):
+        return str(query).lower().translate(str.maketrans("\r\n\t,", "    ")).split()
+
+    def filter_obejct_query(self, query, index_iter, query_index_file, result_file, query_key,
+                            search_object, info_included, structured_info, limit, start,
+                            num_found, debug):
+        query_words = self.get_query_words(query)
         if debug:
             print("    Filtering...")
             t1 = time.time()
-        fcount = 0
         objects = []
-        with index_iter:
-            for line in index_iter:
-                if all(word in line.lower() for word in query_words):
-                    if fcount >= start and fcount < start + limit:
-                        objects.append(self.unpack_objects(line.rstrip('\n'), info_included))
-                    fcount += 1
-                    if num_found is not None and fcount >= start + limit:
-                        # Having shortcut when real num_found was already known
-                        fcount = num_found
-                        break
+        index, row_order = index_iter
+        with index, row_order:
+            columns = [index.column(info) for info in info_included]
+            if (any(len(word) >= NGRAM_SIZE for word in query_words)
+                    and not os.path.isfile(result_file)):
+                # the query index is only built once a query can use it
+                self.ensure_index_file(query_index_file, self.build_query_index, index,
+                                       info_included, query_index_file, debug)
+            if num_found is None:
+                num_found = self.num_found_cache.get(query_key)
+            rows, fcount = self.get_result_rows(query_words, row_order, columns,
+                                                query_index_file, result_file, start + limit,
+                                                num_found)
+            if num_found is None:
+                self.num_found_cache.put(query_key, fcount)
+            encoded_columns = [index.column(info + ".json") for info in structured_info]
+            for row in rows[start:start + limit]:
+                search_object_info = self.unpack_objects(
+                    [column[row] for column in columns], info_included)
+                for info, column in zip(structured_info, encoded_columns):
+                    if info in info_included and search_object_info[info] is None:
+                        continue
+                    encoded = column[row]
+                    search_object_info[info] = json.loads(encoded) if encoded else None
+                objects.append(search_object_info)
         if debug:
             print("    (time=" + str(time.time() - t1) + ")")
         return {"num_found": fcount, "start": start,
                 f"{search_object}": objects,
                 "query": query}
 
-    def unpack_objects(self, line, info_included, items=None):
+    def get_result_rows(self, query_words, row_order, columns, query_index_file, result_file,
+                        max_rows, num_found):
+        """
+        Return the ordered row ids of a search (at least its first max_rows)
+        together with the total number of matching rows. Pages within the first
+        max_top_k_size rows are picked with a bounded heap, every ordering that
+        has to be computed in full is saved to the result file, so later pages
+        of the same search are a slice of the saved rows. When num_found is
+        already known, rows that need to be checked against their text are only
+        checked until the first max_rows matches are found.
+        """
+        if os.path.isfile(result_file):
+            self.track_index_file(result_file)
+            with ColumnarIndex(result_file) as result_index:
+                rows = result_index.array("rows")
+            return rows, len(rows)
+        if not query_words:
+            if row_order.has_stored_order() or max_rows <= self.max_top_k_size:
+                return row_order.rows(None, max_rows), row_order.num_rows
+            query_rows = None
+        else:
+            query_rows, inexact_words = self.find_query_candidates(query_words, query_index_file)
+            if query_rows is None:
+                query_rows = range(row_order.num_rows)
+            if inexact_words:
+                if num_found is not None:
+                    # Having shortcut when real num_found was already known
+                    matches = (row for row in row_order.iter_rows(query_rows)
+                               if self.row_contains_words(row, inexact_words, columns))
+                    return list(itertools.islice(matches, max_rows)), num_found
+                query_rows = {row for row in query_rows
+                              if self.row_contains_words(row, inexact_words, columns)}
+            if max_rows <= self.max_top_k_size:
+                # first pages only order the matching rows they show, the
+                # rows are sorted in full and saved once deeper pages are needed
+                return row_order.rows(query_rows, max_rows), len(query_rows)
+        rows = row_order.rows(query_rows)
+        with ColumnarIndexWriter(result_file) as writer:
+            writer.meta.update({"num_rows": len(rows)})
+            writer.add_array("rows", array("I", rows))
+        self.track_index_file(result_file, built=True)
+        return rows, len(rows)
+
+    def find_query_candidates(self, query_words, query_index_file):
+        """
+        Return the set of rows that may contain every query word as a substring
+        of one of their columns (a query word can't contain a tab, so this is
+        the same as matching the whole tab-separated row), or None for all rows
+        when no word is long enough for the query index, and the words that
+        still have to be checked against the text of these rows.
+        """
+        query_words = set(query_words)
+        if not any(len(word) >= NGRAM_SIZE for word in query_words):
+            return None, list(query_words)
+        with NGramIndex(query_index_file) as ngram_index:
+            rows = None
+            for word in sorted(query_words, key=len, reverse=True):
+                if not ngram_index.is_indexed(word):
+                    continue
+                word_rows = ngram_index.candidates(word)
+                rows = word_rows if rows is None else rows & word_rows
+                if not rows:
+                    return rows, []
+            return rows, [word for word in query_words if not ngram_index.is_exact(word)]
+
+    def row_contains_words(self, row, words, columns):
+        texts = [column[row].lower() for column in columns]
+        return all(any(word in text for text in texts) for word in words)
+
+    def unpack_objects(self, items, info_included):
         try:
-            if items is None:
-                items = line.split('\t')
-
             search_object_info = {}
             index = 0
             for item in items:
@@ -226,5 +379,5 @@ class TableIndexer:
 
             return search_object_info
         except:
-            raise ValueError(f"Error parsing bin from: [{line}]\n"
+            raise ValueError(f"Error parsing bin from: {items}\n"
                              "Cause: " + traceback.format_exc())
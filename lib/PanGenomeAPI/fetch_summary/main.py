@@ -1,13 +1,37 @@
 """
 Fetch and construct summary data for previewing a pangenome.
 """
+import numpy as np
+
+from PanGenomeAPI.AsyncExecutor import async_executor
+from PanGenomeAPI.AsyncWorkspace import AsyncWorkspace
+from PanGenomeAPI.ObjectInfoCache import ObjectInfoCache
 from installed_clients.WorkspaceClient import Workspace as Workspace
 
+# subpaths of the pangenome object read by the summary
+SUMMARY_INCLUDED_PATHS = ["/id", "/genome_refs", "/orthologs/[*]/orthologs"]
+# genome infos of all the summaries served by the worker process
+_genome_info_cache = ObjectInfoCache()
+# ways of computing the shared family counts, see _shared_families
+SHARED_FAMILY_MODES = ("auto", "dense", "sparse")
+# number of families per block of the incidence matrix Gram product
+_FAMILY_BLOCK_SIZE = 4096
+# genome sets of at least this many genomes are merged when identical
+_MERGE_MIN_SIZE = 16
+# maximum number of genome pairs expanded at once by the sparse Gram product
+_PAIR_CHUNK_SIZE = 1 << 22
+# estimated cost of one expanded genome pair relative to a dense multiply-add,
+# used to pick the cheaper product in "auto" mode
+_SPARSE_PAIR_COST = 32
+
 
 def fetch_pangenome_summary(
         pangenome_ref: str,
         workspace_url: str,
-        token: str) -> dict:
+        token: str,
+        shared_family_mode: str = "auto",
+        info_batch_size: int = 100,
+        info_concurrency: int = 4) -> dict:
     """
     Construct a summary data object for a single pangenome, used in the
     "simple_summary" method.
@@ -15,79 +39,278 @@ def fetch_pangenome_summary(
         pangenome_ref: Workspace reference to the pangenome object
         workspace_url: URL of the Workspace being used in the current env
         token: authorization token for fetching the data
+        shared_family_mode: one of SHARED_FAMILY_MODES, see _shared_families
+        info_batch_size: maximum number of genomes per get_object_info3 call
+        info_concurrency: maximum number of get_object_info3 calls in flight
     Returns:
         A python object adhering to the SimpleSummaryResult type in
         PanGenomeAPI.spec
     """
     ws_client = Workspace(workspace_url, token=token)
-    # Download the full pangenome workspace dataset
+    # Download only the parts of the pangenome the summary uses: the genomes
+    # and the genes of every family, without the family annotations and
+    # protein sequences
     resp = ws_client.get_objects2({
-        'objects': [{'ref': pangenome_ref}]
+        'objects': [{'ref': pangenome_ref, 'included': SUMMARY_INCLUDED_PATHS}]
     })
     data = resp['data'][0]['data']
     # Fetch the object infos for each genome
-    genome_refs = [{"ref": ref} for ref in data["genome_refs"]]
-    genome_infos = ws_client.get_object_info3({
-        "objects": genome_refs,
-        "includeMetadata": 1
-    })["infos"]
+    genome_infos = async_executor.run(_fetch_genome_infos(
+        data["genome_refs"], workspace_url, token, info_batch_size, info_concurrency))
     name_mapping = _genome_name_mapping(genome_infos)
+    counts = _aggregate_orthologs(data, list(name_mapping), shared_family_mode)
     ret = {
         "pangenome_id": data["id"],
         "genomes_count": len(data["genome_refs"]),
-        "genes": _count_genes(data),
-        "families": _count_families(data),
-        "genomes": _genome_counts(data, genome_infos, name_mapping),
-        "shared_family_map": _shared_family_map(data, name_mapping),
+        "genes": _count_genes(counts["family_sizes"]),
+        "families": _count_families(counts["family_sizes"]),
+        "genomes": _genome_counts(counts, genome_infos, name_mapping),
+        "shared_family_map": _shared_family_map(counts, name_mapping),
         "genome_ref_name_map": name_mapping,
     }
     return ret
 
 
-def _count_genes(pg_data: dict) -> dict:
+async def _fetch_genome_infos(
+        genome_refs: list,
+        workspace_url: str,
+        token: str,
+        batch_size: int,
+        concurrency: int) -> list:
     """
-    Calculate gene counts for a pangenome object
+    Fetch the object infos with metadata of the genomes, in batches of
+    concurrent get_object_info3 calls for the ones not cached yet
+    Args:
+        genome_refs: workspace refs of the genomes
+        workspace_url: URL of the Workspace being used in the current env
+        token: authorization token for fetching the data
+        batch_size: maximum number of genomes per get_object_info3 call
+        concurrency: maximum number of get_object_info3 calls in flight
+    Returns:
+        list of object info tuples (with metadata) in the order of genome_refs
+    """
+    async with AsyncWorkspace(workspace_url, token=token,
+                              max_concurrency=concurrency) as ws:
+        return await _genome_info_cache.get_infos(ws, token, genome_refs, batch_size)
+
+
+def _aggregate_orthologs(
+        pg_data: dict,
+        genome_refs: list,
+        shared_family_mode: str = "auto") -> dict:
+    """
+    Aggregate the gene and family counts of the pangenome in a single pass
+    over the ortholog families. Every family is encoded as the array of the
+    genome indices of its genes, all counts are then computed with NumPy.
     Args:
         pg_data: workspace data object for the Pangenome
+        genome_refs: workspace refs of the genomes, in the order of the
+            returned per-genome counts
+        shared_family_mode: one of SHARED_FAMILY_MODES, see _shared_families
+    Returns:
+        dict of NumPy arrays:
+            "family_sizes": number of genes of every family
+            "homolog_family_genes": per genome, genes in homolog families
+            "homolog_families": per genome, homolog families with genes in it
+            "shared_families": genome x genome matrix of the number of
+                homolog families with genes in both genomes
+    """
+    genome_index = {ref: pos for pos, ref in enumerate(genome_refs)}
+    num_genomes = len(genome_refs)
+    families = pg_data["orthologs"]
+    family_sizes = np.zeros(len(families), dtype=np.int64)
+    gene_genomes = []
+    for pos, family in enumerate(families):
+        genes = family["orthologs"]
+        family_sizes[pos] = len(genes)
+        gene_genomes.extend(genome_index[gene[2]] for gene in genes)
+    gene_genomes = np.array(gene_genomes, dtype=np.int64)
+
+    # genes of homolog (non-singleton) families only
+    homolog_genes = np.repeat(family_sizes > 1, family_sizes)
+    gene_families = np.repeat(np.arange(len(families)), family_sizes)[homolog_genes]
+    gene_genomes = gene_genomes[homolog_genes]
+    homolog_family_genes = np.bincount(gene_genomes, minlength=num_genomes)
+
+    # sparse family x genome incidence matrix, as its sorted non-zero entries
+    incidence = np.unique(gene_families * num_genomes + gene_genomes)
+    incidence_families, incidence_genomes = np.divmod(incidence, num_genomes)
+    homolog_families = np.bincount(incidence_genomes, minlength=num_genomes)
+
+    shared_families = _shared_families(incidence_families, incidence_genomes,
+                                       num_genomes, shared_family_mode)
+
+    return {
+        "family_sizes": family_sizes,
+        "homolog_family_genes": homolog_family_genes,
+        "homolog_families": homolog_families,
+        "shared_families": shared_families,
+    }
+
+
+def _shared_families(
+        incidence_families: np.ndarray,
+        incidence_genomes: np.ndarray,
+        num_genomes: int,
+        mode: str = "auto") -> np.ndarray:
+    """
+    Calculate the Gram product of the family x genome incidence matrix, that
+    is the number of families with genes in both genomes of every pair.
+    "dense" accumulates it over dense blocks of families, at a cost of
+    families x genomes^2 multiply-adds. "sparse" first merges the large
+    families with the same set of genomes (like the core families) into one
+    weighted set, then expands every set into its genome pairs, so its cost
+    scales with the non-zeros of the product instead. "auto" merges the same
+    way and uses the dense product only for the sets where it is cheaper.
+    Args:
+        incidence_families: family index of every non-zero entry, sorted
+        incidence_genomes: genome index of every non-zero entry
+        num_genomes: number of genomes (columns) of the incidence matrix
+        mode: one of SHARED_FAMILY_MODES
+    Returns:
+        genome x genome matrix of the shared family counts
+    """
+    if mode not in SHARED_FAMILY_MODES:
+        raise ValueError(f"Unknown shared family mode: {mode}, "
+                         f"expected one of {', '.join(SHARED_FAMILY_MODES)}")
+    # genome sets of the families: set index and genome of every entry, number
+    # of genomes and number of families of every set
+    set_sizes = np.unique(incidence_families, return_counts=True)[1]
+    genome_sets = (np.repeat(np.arange(len(set_sizes)), set_sizes), incidence_genomes,
+                   set_sizes, np.ones(len(set_sizes), dtype=np.int64))
+    if mode == "dense":
+        return _dense_gram(genome_sets, num_genomes)
+    large = set_sizes >= _MERGE_MIN_SIZE
+    genome_sets = _concat_genome_sets(_take_genome_sets(genome_sets, ~large),
+                                      _merge_genome_sets(_take_genome_sets(genome_sets, large),
+                                                         num_genomes))
+    set_sizes = genome_sets[2]
+    if mode == "auto":
+        dense = set_sizes ** 2 * _SPARSE_PAIR_COST > num_genomes ** 2
+    else:
+        dense = np.zeros(len(set_sizes), dtype=bool)
+    return (_dense_gram(_take_genome_sets(genome_sets, dense), num_genomes)
+            + _sparse_gram(_take_genome_sets(genome_sets, ~dense), num_genomes))
+
+
+def _take_genome_sets(genome_sets: tuple, mask: np.ndarray) -> tuple:
+    """Select the genome sets of a boolean mask"""
+    set_pos, genomes, set_sizes, weights = genome_sets
+    entries = mask[set_pos]
+    return (np.cumsum(mask)[set_pos[entries]] - 1, genomes[entries],
+            set_sizes[mask], weights[mask])
+
+
+def _concat_genome_sets(first: tuple, second: tuple) -> tuple:
+    """Append the genome sets of second to the ones of first"""
+    return (np.concatenate((first[0], second[0] + len(first[2]))),
+            *(np.concatenate((first_part, second_part))
+              for first_part, second_part in zip(first[1:], second[1:])))
+
+
+def _merge_genome_sets(genome_sets: tuple, num_genomes: int) -> tuple:
+    """
+    Merge the identical genome sets into one, weighted by their total number
+    of families. Sets are compared as rows of genome bits.
+    """
+    set_pos, genomes, set_sizes, weights = genome_sets
+    if len(set_sizes) == 0:
+        return genome_sets
+    row_bytes = (num_genomes + 7) // 8
+    bits = np.bincount(set_pos * row_bytes + genomes // 8,
+                       weights=np.left_shift(1, 7 - genomes % 8),
+                       minlength=len(set_sizes) * row_bytes)
+    rows, inverse = np.unique(bits.astype(np.uint8).reshape(-1, row_bytes),
+                              axis=0, return_inverse=True)
+    set_pos, genomes = np.nonzero(np.unpackbits(rows, axis=1, count=num_genomes))
+    return (set_pos, genomes, np.bincount(set_pos),
+            np.bincount(inverse.ravel(), weights=weights).astype(np.int64))
+
+
+def _dense_gram(genome_sets: tuple, num_genomes: int) -> np.ndarray:
+    """
+    Accumulate the weighted Gram product of the genome sets over dense blocks
+    of _FAMILY_BLOCK_SIZE sets
+    """
+    set_pos, genomes, set_sizes, weights = genome_sets
+    shared_families = np.zeros((num_genomes, num_genomes), dtype=np.int64)
+    block_bounds = np.searchsorted(
+        set_pos, np.arange(0, len(set_sizes) + _FAMILY_BLOCK_SIZE, _FAMILY_BLOCK_SIZE))
+    for block_pos, (begin, end) in enumerate(zip(block_bounds, block_bounds[1:])):
+        if begin == end:
+            continue
+        block_start = block_pos * _FAMILY_BLOCK_SIZE
+        block_weights = weights[block_start:block_start + _FAMILY_BLOCK_SIZE]
+        block = np.zeros((len(block_weights), num_genomes))
+        # rows scaled by the square root of their weight keep the product in
+        # the symmetric A.T @ A form, which NumPy computes at half the cost
+        block[set_pos[begin:end] - block_start, genomes[begin:end]] = \
+            np.sqrt(block_weights)[set_pos[begin:end] - block_start]
+        shared_families += np.rint(block.T @ block).astype(np.int64)
+    return shared_families
+
+
+def _sparse_gram(genome_sets: tuple, num_genomes: int) -> np.ndarray:
+    """
+    Accumulate the weighted Gram product of the genome sets by expanding
+    every set into all its genome pairs, at most about _PAIR_CHUNK_SIZE
+    pairs at a time
+    """
+    set_pos, genomes, set_sizes, weights = genome_sets
+    shared_families = np.zeros(num_genomes ** 2, dtype=np.int64)
+    pair_counts = set_sizes ** 2
+    pair_ends = np.cumsum(pair_counts)
+    set_starts = np.append(np.cumsum(set_sizes) - set_sizes, len(genomes))
+    begin = 0
+    while begin < len(set_sizes):
+        max_pairs = pair_ends[begin] - pair_counts[begin] + _PAIR_CHUNK_SIZE
+        end = max(begin + 1, int(np.searchsorted(pair_ends, max_pairs, "right")))
+        chunk = slice(set_starts[begin], set_starts[end])
+        chunk_set_pos = set_pos[chunk] - begin
+        chunk_genomes = genomes[chunk]
+        # every entry is paired with each entry of its set in turn
+        entry_sizes = set_sizes[begin:end][chunk_set_pos]
+        pair_entries = np.repeat(np.arange(len(chunk_genomes)), entry_sizes)
+        pair_offsets = np.arange(len(pair_entries)) - np.repeat(
+            np.cumsum(entry_sizes) - entry_sizes, entry_sizes)
+        first_entries = set_starts[begin:end][chunk_set_pos] - set_starts[begin]
+        pair_ids = (chunk_genomes[pair_entries] * num_genomes
+                    + chunk_genomes[first_entries[pair_entries] + pair_offsets])
+        shared_families += np.rint(np.bincount(
+            pair_ids, weights=weights[begin:end][chunk_set_pos][pair_entries],
+            minlength=num_genomes ** 2)).astype(np.int64)
+        begin = end
+    return shared_families.reshape(num_genomes, num_genomes)
+
+
+def _count_genes(family_sizes: np.ndarray) -> dict:
+    """
+    Calculate gene counts for a pangenome object
+    Args:
+        family_sizes: number of genes of every ortholog family
     Returns:
         Dict of counts with the GeneFamilyReport type in PanGenomeAPI.spec
     """
-    counts = {
-        "genes_count": 0,
-        "homolog_family_genes_count": 0,
-        "singleton_family_genes_count": 0,
+    return {
+        "genes_count": int(family_sizes.sum()),
+        "homolog_family_genes_count": int(family_sizes[family_sizes > 1].sum()),
+        "singleton_family_genes_count": int((family_sizes == 1).sum()),
     }
-    for family in pg_data["orthologs"]:
-        count = len(family["orthologs"])
-        counts["genes_count"] += count
-        if count == 1:
-            counts["singleton_family_genes_count"] += count
-        elif count > 1:
-            counts["homolog_family_genes_count"] += count
-    return counts
 
 
-def _count_families(pg_data: dict) -> dict:
+def _count_families(family_sizes: np.ndarray) -> dict:
     """
     Aggregate counts for the homolog families in the pangenome
     Args:
-        pg_data: workspace data object for the Pangenome
+        family_sizes: number of genes of every ortholog family
     Returns:
         dict matching the type FamilyReport from PanGenomeAPI.spec
     """
-    counts = {
-        "families_count": 0,
-        "homolog_families_count": 0,
-        "singleton_families_count": 0,
+    return {
+        "families_count": len(family_sizes),
+        "homolog_families_count": int((family_sizes > 1).sum()),
+        "singleton_families_count": int((family_sizes == 1).sum()),
     }
-    counts["families_count"] = len(pg_data["orthologs"])
-    for family in pg_data["orthologs"]:
-        count = len(family["orthologs"])
-        if count == 1:
-            counts["singleton_families_count"] += 1
-        elif count > 1:
-            counts["homolog_families_count"] += 1
-    return counts
 
 
 def _genome_name_mapping(genome_infos: list) -> dict:
@@ -116,59 +339,40 @@ def _genome_name_mapping(genome_infos: list) -> dict:
 
 
 def _genome_counts(
-        pg_data: dict,
+        counts: dict,
         genome_infos: list,
         name_mapping: dict) -> dict:
     """
     Aggregate counts of genes and families for every genome
     Args:
-        pg_data: workspace data object for the Pangenome
+        counts: result of _aggregate_orthologs for the genomes of name_mapping
         genome_infos: list of genome info tuples for each object
         name_mapping: mapping of workspace ref to readable name for use as keys
     Returns:
         Mapping of genome ref to GenomeGeneFamilyReport (from
         PanGenomeAPI.spec)
     """
-    # Initialize the result structure
+    feature_counts = {_get_ref(info): _get_feature_count(info) for info in genome_infos}
+    homolog_family_genes = counts["homolog_family_genes"].tolist()
+    homolog_families = counts["homolog_families"].tolist()
     ret = {}
-    for name in name_mapping.values():
+    for pos, (ref, name) in enumerate(name_mapping.items()):
+        # Singleton family genes are the difference of the total features
+        # and the homolog family genes
         ret[name] = {
-            "genome_genes": 0,
-            "genome_homolog_family_genes": 0,
-            "genome_singleton_family_genes": 0,
-            "genome_homolog_family": 0,
+            "genome_genes": feature_counts[ref],
+            "genome_homolog_family_genes": homolog_family_genes[pos],
+            "genome_singleton_family_genes": feature_counts[ref] - homolog_family_genes[pos],
+            "genome_homolog_family": homolog_families[pos],
         }
-    # Set total feature counts from the obj info
-    for info in genome_infos:
-        key = name_mapping[_get_ref(info)]
-        ret[key]["genome_genes"] = _get_feature_count(info)
-    # Aggregate other counts from the ortholog families
-    for family in pg_data["orthologs"]:
-        count = len(family["orthologs"])
-        found_genomes = set()
-        for gene in family["orthologs"]:
-            genome_ref = gene[2]
-            key = name_mapping[genome_ref]
-            if count > 1:
-                ret[key]["genome_homolog_family_genes"] += 1
-                found_genomes.add(genome_ref)
-        for ref in found_genomes:
-            ret[name_mapping[ref]]["genome_homolog_family"] += 1
-    # Set the singleton family gene counts to be the difference of the total
-    # features and the homolog family counts
-    for ref in pg_data["genome_refs"]:
-        key = name_mapping[ref]
-        total = ret[key]["genome_genes"]
-        homologs = ret[key]["genome_homolog_family_genes"]
-        ret[key]["genome_singleton_family_genes"] = total - homologs
     return ret
 
 
-def _shared_family_map(pg_data: dict, name_mapping: dict) -> dict:
+def _shared_family_map(counts: dict, name_mapping: dict) -> dict:
     """
     Calculate the number of shared ortholog families between any two genomes
     Args:
-        pg_data: workspace data object for the Pangenome
+        counts: result of _aggregate_orthologs for the genomes of name_mapping
         name_mapping: mapping of workspace ref to readable name for use as keys
     Returns:
         dict where keys are genome refs, and values are mapping of genome refs
@@ -176,25 +380,9 @@ def _shared_family_map(pg_data: dict, name_mapping: dict) -> dict:
         Example: {"1": {"2": 10}} represents genome "1" and "2" sharing 10
         families
     """
-    # Initialize the return structure
-    ret = {}
-    for ref1 in pg_data["genome_refs"]:
-        key1 = name_mapping[ref1]
-        ret[key1] = {}
-        for ref2 in pg_data["genome_refs"]:
-            key2 = name_mapping[ref2]
-            ret[key1][key2] = 0
-    # Aggregate counts of all genomes that share genes in an ortholog family
-    for family in pg_data["orthologs"]:
-        if len(family["orthologs"]) <= 1:
-            # We only record non-singletons
-            continue
-        genome_refs = set(orth[2] for orth in family["orthologs"])
-        for ref1 in genome_refs:
-            for ref2 in genome_refs:
-                key1, key2 = name_mapping[ref1], name_mapping[ref2]
-                ret[key1][key2] += 1
-    return ret
+    names = list(name_mapping.values())
+    return {name: dict(zip(names, row))
+            for name, row in zip(names, counts["shared_families"].tolist())}
 
 
 def _get_feature_count(genome_info: dict) -> int:
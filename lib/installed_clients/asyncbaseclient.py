@@ -0,0 +1,124 @@
+import asyncio as _asyncio
+import json as _json
+import random as _random
+from urllib.parse import urlparse as _urlparse
+
+import aiohttp as _aiohttp
+
+from .baseclient import ServerError, _JSONObjectEncoder, _CT, _AJ, get_timeout
+
+_URL_SCHEME = frozenset(['http', 'https'])
+
+
+class AsyncBaseClient(object):
+    '''
+    The asyncio variant of the KBase base client, for callers that fan out
+    many calls to a service from one thread.
+    Required initialization arguments (positional):
+    url - the url of the service to contact.
+    Optional arguments (keywords in positional order):
+    timeout - methods will fail if they take longer than this value in seconds.
+        Default 1800. The connect and read timeouts configured with
+        baseclient.configure_session apply here as well.
+    token - a KBase authentication token.
+    trust_all_ssl_certificates - set to True to trust self-signed certificates.
+        If you don't understand the implications, leave as the default, False.
+    max_concurrency - the maximum number of calls in flight at once, further
+        calls wait for a free connection. Default 10.
+    The client has to be used as an async context manager, which owns the
+    keep-alive connections of all the calls made inside the block:
+        async with AsyncBaseClient(url, token=token) as client:
+            results = await asyncio.gather(*[client.call_method(...), ...])
+    '''
+    def __init__(self, url=None, timeout=30 * 60, token=None,
+                 trust_all_ssl_certificates=False, max_concurrency=10):
+        if url is None:
+            raise ValueError('A url is required')
+        scheme, _, _, _, _, _ = _urlparse(url)
+        if scheme not in _URL_SCHEME:
+            raise ValueError(url + " isn't a valid http url")
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+        self.url = url
+        self.timeout = int(timeout)
+        if self.timeout < 1:
+            raise ValueError('Timeout value must be at least 1 second')
+        self._headers = dict()
+        if token is not None:
+            self._headers['AUTHORIZATION'] = token
+        self.trust_all_ssl_certificates = trust_all_ssl_certificates
+        self.max_concurrency = max_concurrency
+        self._session = None
+
+    async def __aenter__(self):
+        connect_timeout, read_timeout = get_timeout(self.timeout)
+        self._session = _aiohttp.ClientSession(
+            connector=_aiohttp.TCPConnector(limit=self.max_concurrency,
+                                            ssl=not self.trust_all_ssl_certificates),
+            timeout=_aiohttp.ClientTimeout(connect=connect_timeout,
+                                           sock_read=read_timeout),
+            cookie_jar=_aiohttp.DummyCookieJar())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _call(self, url, method, params, context=None):
+        if self._session is None:
+            raise RuntimeError('AsyncBaseClient has to be used inside "async with"')
+        arg_hash = {'method': method,
+                    'params': params,
+                    'version': '1.1',
+                    'id': str(_random.random())[2:]
+                    }
+        if context:
+            if type(context) is not dict:
+                raise ValueError('context is not type dict as required.')
+            arg_hash['context'] = context
+
+        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
+        async with self._session.post(url, data=body, headers=self._headers) as ret:
+            text = await ret.text(encoding='utf-8')
+            if ret.status == 500:
+                if ret.headers.get(_CT) == _AJ:
+                    err = _json.loads(text)
+                    if 'error' in err:
+                        raise ServerError(**err['error'])
+                raise ServerError('Unknown', 0, text)
+            ret.raise_for_status()
+        # large results are decoded off the event loop
+        resp = await _asyncio.get_running_loop().run_in_executor(None, _json.loads, text)
+        if 'result' not in resp:
+            raise ServerError('Unknown', 0, 'An unknown server error occurred')
+        if not resp['result']:
+            return
+        if len(resp['result']) == 1:
+            return resp['result'][0]
+        return resp['result']
+
+    def _set_up_context(self, service_ver=None, context=None):
+        if service_ver:
+            if not context:
+                context = {}
+            context['service_ver'] = service_ver
+        return context
+
+    async def call_method(self, service_method, args, service_ver=None,
+                          context=None):
+        '''
+        Call a standard service asynchronously.
+        Required arguments:
+        service_method - the service and method to run, e.g. myserv.mymeth.
+        args - a list of arguments to the method.
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        '''
+        context = self._set_up_context(service_ver, context)
+        return await self._call(self.url, service_method, args, context)
@@ -11,7 +11,9 @@ import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import threading as _threading
 import traceback as _traceback
+from http.cookiejar import DefaultCookiePolicy as _DefaultCookiePolicy
 from requests.exceptions import ConnectionError
 from urllib3.exceptions import ProtocolError
 
@@ -31,6 +33,61 @@ _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
 
+# HTTP transport shared by all clients of the process (see configure_session)
+_session = None
+_session_lock = _threading.Lock()
+_pool_size = 10
+_connect_timeout = None
+_read_timeout = None
+
+
+def configure_session(pool_size=10, connect_timeout=None, read_timeout=None):
+    '''
+    Set up the pooled HTTP session used by every client of the process.
+    pool_size - number of keep-alive connections kept per host.
+    connect_timeout - seconds to wait for a connection, the timeout of the
+        clients by default.
+    read_timeout - seconds to wait for a response, overrides the timeout of
+        the clients when set.
+    '''
+    global _session, _pool_size, _connect_timeout, _read_timeout
+    with _session_lock:
+        _pool_size = int(pool_size)
+        _connect_timeout = connect_timeout
+        _read_timeout = read_timeout
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session():
+    '''
+    Return the shared requests.Session, connections to the services are kept
+    alive and reused across calls, clients and tokens. Tokens are sent with
+    every request and cookies are never stored, so nothing of one caller
+    leaks into the calls of another.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = _requests.Session()
+            session.cookies.set_policy(_DefaultCookiePolicy(allowed_domains=[]))
+            adapter = _requests.adapters.HTTPAdapter(pool_connections=_pool_size,
+                                                     pool_maxsize=_pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def get_timeout(timeout):
+    '''
+    Return the (connect, read) timeout of a call of a client with the given
+    timeout.
+    '''
+    return (timeout if _connect_timeout is None else _connect_timeout,
+            timeout if _read_timeout is None else _read_timeout)
+
 
 def _get_token(user_id, password, auth_svc):
     # This is bandaid helper function until we get a full
@@ -176,9 +233,9 @@ class BaseClient(object):
             arg_hash['context'] = context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        ret = get_session().post(url, data=body, headers=self._headers,
+                                 timeout=get_timeout(self.timeout),
+                                 verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
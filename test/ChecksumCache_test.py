@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PanGenomeAPI.ChecksumCache import ChecksumCache, is_pinned_ref
+from PanGenomeAPI.LRUCache import LRUCache
+from PanGenomeAPI.TableIndexer import TableIndexer
+
+
+class _FakeWorkspace:
+
+    calls = []
+
+    def __init__(self, url=None, token=None):
+        self.token = token
+
+    def get_object_info3(self, params):
+        refs = [obj['ref'] for obj in params['objects']]
+        _FakeWorkspace.calls.append((self.token, refs))
+        return {'infos': [[1, 'obj', 'KBaseGenomes.Pangenome-4.0', '', 1, 'user', 1, 'ws',
+                           'chsum_' + ref.replace('/', '_').replace(';', '_'), 1, {}]
+                          for ref in refs]}
+
+
+class ChecksumCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        _FakeWorkspace.calls = []
+        self.now = 1000.0
+        patcher = mock.patch('PanGenomeAPI.LRUCache.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ChecksumCache(ttl=300)
+
+    def get_checksums(self, token, refs):
+        return self.cache.get_checksums(_FakeWorkspace(token=token), token, refs)
+
+    def test_is_pinned_ref(self):
+        self.assertTrue(is_pinned_ref('1/2/3'))
+        self.assertTrue(is_pinned_ref('1/2/3;4/5/6'))
+        self.assertTrue(is_pinned_ref('1/2/3; 4/5/6'))
+        self.assertFalse(is_pinned_ref('1/2'))
+        self.assertFalse(is_pinned_ref('1/2/3;4/5'))
+        self.assertFalse(is_pinned_ref('ws/obj/3'))
+        self.assertFalse(is_pinned_ref('1/obj/3'))
+        self.assertFalse(is_pinned_ref('ws/obj'))
+        self.assertFalse(is_pinned_ref('1/2/3/4'))
+        self.assertFalse(is_pinned_ref(''))
+
+    def test_one_call_for_missing_refs(self):
+        self.assertEqual(self.get_checksums('t1', ['1/2/3', '1/2', '1/2/3']),
+                         ['chsum_1_2_3', 'chsum_1_2', 'chsum_1_2_3'])
+        self.assertEqual(self.get_checksums('t1', ['1/2', '4/5/6', '1/2/3']),
+                         ['chsum_1_2', 'chsum_4_5_6', 'chsum_1_2_3'])
+        self.assertEqual(_FakeWorkspace.calls, [('t1', ['1/2', '1/2/3']), ('t1', ['4/5/6'])])
+
+    def test_ttl_of_refs_that_are_not_pinned(self):
+        refs = ['1/2/3', '1/2/3;4/5/6', '1/2', 'ws/obj', '1/2/3;4/5']
+        self.get_checksums('t1', refs)
+        self.now += 299
+        self.get_checksums('t1', refs)
+        self.assertEqual(len(_FakeWorkspace.calls), 1)
+        # pinned refs never expire, the others are fetched again after the ttl
+        self.now += 2
+        self.get_checksums('t1', refs)
+        self.now += 10 ** 6
+        self.get_checksums('t1', ['1/2/3', '1/2/3;4/5/6'])
+        self.assertEqual(_FakeWorkspace.calls[1:],
+                         [('t1', ['1/2', '1/2/3;4/5', 'ws/obj'])])
+
+    def test_scoped_by_token(self):
+        self.assertEqual(self.cache.get_checksum(_FakeWorkspace(token='t1'), 't1', '1/2/3'),
+                         'chsum_1_2_3')
+        self.cache.get_checksum(_FakeWorkspace(token='t2'), 't2', '1/2/3')
+        self.cache.get_checksum(_FakeWorkspace(token='t1'), 't1', '1/2/3')
+        self.cache.get_checksum(_FakeWorkspace(token=None), None, '1/2/3')
+        # every user has to be let in by the workspace once
+        self.assertEqual(_FakeWorkspace.calls, [('t1', ['1/2/3']), ('t2', ['1/2/3']),
+                                                (None, ['1/2/3'])])
+
+
+class WarmSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        _FakeWorkspace.calls = []
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        for target, new in (('PanGenomeAPI.TableIndexer.Workspace', _FakeWorkspace),
+                            ('PanGenomeAPI.TableIndexer.TableIndexer.num_found_cache',
+                             LRUCache(10000)),
+                            ('PanGenomeAPI.TableIndexer.TableIndexer.checksum_cache',
+                             ChecksumCache())):
+            patcher = mock.patch(target, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def search(self, token, ref):
+        indexer = TableIndexer(token, 'http://localhost')
+        return indexer.run_search(ref, self.index_dir, '_orthologs', 'orthologs',
+                                  ['id', 'function'], 'kinase', None, 0, 10, None, False)
+
+    def test_warm_search_makes_no_workspace_call(self):
+        indexer = TableIndexer('t1', 'http://localhost')
+        indexer.save_object_index([{'id': 'fam1', 'function': 'kinase'},
+                                   {'id': 'fam2', 'function': 'ATPase'}],
+                                  'chsum_1_2_3', ['id', 'function'], (), self.index_dir,
+                                  '_orthologs')
+        cold = self.search('t1', '1/2/3')
+        self.assertEqual(len(_FakeWorkspace.calls), 1)
+        _FakeWorkspace.calls = []
+        self.assertEqual(self.search('t1', '1/2/3'), cold)
+        self.assertEqual(_FakeWorkspace.calls, [])
+        # another user of the same object is checked by the workspace first
+        self.assertEqual(self.search('t2', '1/2/3'), cold)
+        self.assertEqual(_FakeWorkspace.calls, [('t2', ['1/2/3'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
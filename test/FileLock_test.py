@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from PanGenomeAPI.FileLock import FileLock, build_once, remove_lock_file
+
+_NUM_THREADS = 8
+
+
+class FileLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        self.index_file = os.path.join(self.index_dir, 'a.cidx')
+        self.builds = []
+        self.builds_lock = threading.Lock()
+
+    def slow_build(self, index_file, content):
+        with self.builds_lock:
+            self.builds.append(threading.get_ident())
+        time.sleep(0.2)
+        with open(index_file + '.tmp', 'w') as outfile:
+            outfile.write(content)
+        os.replace(index_file + '.tmp', index_file)
+
+    def run_threads(self, target):
+        results = [None] * _NUM_THREADS
+        barrier = threading.Barrier(_NUM_THREADS)
+
+        def run(pos):
+            barrier.wait()
+            results[pos] = target()
+
+        threads = [threading.Thread(target=run, args=(pos,)) for pos in range(_NUM_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def build_and_read(self):
+        built = build_once(self.index_file, self.slow_build, self.index_file, 'rows')
+        with open(self.index_file) as infile:
+            return built, infile.read()
+
+    def test_build_once(self):
+        results = self.run_threads(self.build_and_read)
+        # one caller built the file, the others waited for it and read it
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(sorted(built for built, _ in results),
+                         [False] * (_NUM_THREADS - 1) + [True])
+        self.assertEqual([content for _, content in results], ['rows'] * _NUM_THREADS)
+
+    def test_existing_file_not_rebuilt(self):
+        self.slow_build(self.index_file, 'old rows')
+        self.builds.clear()
+        results = self.run_threads(self.build_and_read)
+        self.assertEqual(self.builds, [])
+        self.assertEqual(results, [(False, 'old rows')] * _NUM_THREADS)
+
+    def test_build_once_after_lock_file_removed(self):
+        # the lock file is removed (the way remove_lock_file does, while it is
+        # locked) when a build already waits for it, and another build starts
+        # on a new lock file: the waiter must not build the file a second time
+        lock_file = self.index_file + '.lock'
+        lock = FileLock(lock_file)
+        lock.acquire()
+        waiter = threading.Thread(target=self.build_and_read)
+        waiter.start()
+        time.sleep(0.1)
+        os.remove(lock_file)
+        builder = threading.Thread(target=self.build_and_read)
+        builder.start()
+        time.sleep(0.1)
+        lock.release()
+        waiter.join()
+        builder.join()
+        self.assertEqual(len(self.builds), 1)
+
+    def test_remove_lock_file(self):
+        lock_file = self.index_file + '.lock'
+        self.assertFalse(remove_lock_file(lock_file))
+        with FileLock(lock_file):
+            # held by a build
+            self.assertFalse(remove_lock_file(lock_file))
+        self.assertTrue(remove_lock_file(lock_file))
+        self.assertFalse(os.path.exists(lock_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
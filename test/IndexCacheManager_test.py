@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from PanGenomeAPI.FileLock import FileLock
+from PanGenomeAPI.IndexCacheManager import IndexCacheManager
+
+
+class IndexCacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+
+    def make_file(self, name, size=100, age=0):
+        path = os.path.join(self.index_dir, name)
+        with open(path, 'wb') as outfile:
+            outfile.write(b'x' * size)
+        self.set_age(name, age)
+        return path
+
+    def set_age(self, name, age):
+        mtime = time.time() - age
+        os.utime(os.path.join(self.index_dir, name), (mtime, mtime))
+
+    def files(self):
+        return sorted(os.listdir(self.index_dir))
+
+    def test_lru_eviction(self):
+        for name, age in [('a.cidx', 3000), ('b.cidx', 1000), ('c.cidx', 2000)]:
+            self.make_file(name, age=age)
+            self.make_file(name + '.lock', size=0)
+        index_cache = IndexCacheManager(self.index_dir, 150, 'lru', min_age=0)
+        index_cache.enforce_quota()
+        # the least recently used files go first, with their lock files
+        self.assertEqual(self.files(), ['b.cidx', 'b.cidx.lock'])
+        self.assertEqual(index_cache.stats()['evicted_files'], 2)
+        self.assertEqual(index_cache.stats()['evicted_bytes'], 200)
+
+    def test_lfu_eviction(self):
+        for name in ['a.cidx', 'b.cidx', 'c.cidx']:
+            self.make_file(name)
+        index_cache = IndexCacheManager(self.index_dir, 150, 'lfu', min_age=0)
+        for name in ['a.cidx', 'a.cidx', 'c.cidx']:
+            index_cache.accessed(os.path.join(self.index_dir, name))
+        for name, age in [('a.cidx', 3000), ('b.cidx', 1000), ('c.cidx', 2000)]:
+            self.set_age(name, age)
+        index_cache.enforce_quota()
+        # b was never used and c less often than a, which is the oldest
+        self.assertEqual(self.files(), ['a.cidx'])
+
+    def test_lfu_ties_broken_by_recency(self):
+        for name, age in [('a.cidx', 1000), ('b.cidx', 3000), ('c.cidx', 2000)]:
+            self.make_file(name, age=age)
+        IndexCacheManager(self.index_dir, 150, 'lfu', min_age=0).enforce_quota()
+        self.assertEqual(self.files(), ['a.cidx'])
+
+    def test_recent_files_not_evicted(self):
+        self.make_file('old.cidx', age=3000)
+        self.make_file('new.cidx', age=60)
+        self.make_file('built.cidx')
+        index_cache = IndexCacheManager(self.index_dir, 100, 'lru', min_age=600)
+        index_cache.added(os.path.join(self.index_dir, 'built.cidx'))
+        # still over the quota, but the rest was used in the last min_age seconds
+        self.assertEqual(self.files(), ['built.cidx', 'new.cidx'])
+
+    def test_no_quota(self):
+        for name in ['a.cidx', 'b.cidx']:
+            self.make_file(name, age=3000)
+        IndexCacheManager(self.index_dir, 0, 'lru', min_age=0).enforce_quota()
+        self.assertEqual(self.files(), ['a.cidx', 'b.cidx'])
+
+    def test_temp_files_count_towards_quota(self):
+        self.make_file('a.cidx', age=3000)
+        self.make_file('b.cidx', age=2000)
+        self.make_file('c.cidx_x.tmp', age=0)
+        IndexCacheManager(self.index_dir, 250, 'lru', min_age=0).enforce_quota()
+        self.assertEqual(self.files(), ['b.cidx', 'c.cidx_x.tmp'])
+
+    def test_held_lock_file_kept(self):
+        self.make_file('a.cidx', age=3000)
+        lock_file = self.make_file('a.cidx.lock', size=0)
+        index_cache = IndexCacheManager(self.index_dir, 50, 'lru', min_age=0)
+        with FileLock(lock_file):
+            index_cache.enforce_quota()
+        self.assertEqual(self.files(), ['a.cidx.lock'])
+
+    def test_collect_garbage(self):
+        self.make_file('crashed.cidx_1.tmp', age=7200)
+        self.make_file('running.cidx_2.tmp', age=60)
+        self.make_file('a.cidx', age=7200)
+        self.make_file('a.cidx.lock', size=0, age=7200)
+        self.make_file('evicted.cidx.lock', size=0, age=7200)
+        held_lock_file = self.make_file('building.cidx.lock', size=0)
+        index_cache = IndexCacheManager(self.index_dir, 0, 'lru', temp_max_age=3600)
+        with FileLock(held_lock_file):
+            index_cache.collect_garbage()
+        self.assertEqual(self.files(), ['a.cidx', 'a.cidx.lock', 'building.cidx.lock',
+                                        'running.cidx_2.tmp'])
+        stats = index_cache.stats()
+        self.assertEqual(stats['temp_files_removed'], 1)
+        self.assertEqual(stats['temp_bytes_removed'], 100)
+        self.assertEqual(stats['num_files'], 1)
+        self.assertEqual(stats['num_temp_files'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
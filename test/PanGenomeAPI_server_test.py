@@ -10,9 +10,11 @@ from pprint import pprint  # noqa: F401
 
 from Bio import SeqIO
 
+from PanGenomeAPI.LRUCache import LRUCache
 from PanGenomeAPI.PanGenomeAPIImpl import PanGenomeAPI
 from PanGenomeAPI.PanGenomeAPIServer import MethodContext
 from PanGenomeAPI.authclient import KBaseAuth as _KBaseAuth
+from PanGenomeAPI.fetch_summary.main import fetch_pangenome_summary
 from installed_clients.GenomeAnnotationAPIClient import GenomeAnnotationAPI
 from installed_clients.GenomeComparisonSDKClient import GenomeComparisonSDK
 from installed_clients.WorkspaceClient import Workspace as workspaceService
@@ -509,6 +511,30 @@ class PanGenomeAPITest(unittest.TestCase):
                 expected = json.load(fd)
             self.assertEqual(ret, expected)
 
+    def test_compute_summary_from_pangenome2_cached(self):
+        ref = "51489/10/1"
+        params = {"pangenome_ref": ref}
+        ret = self.getImpl().compute_summary_from_pangenome2(self.getContext(), params)[0]
+        # repeated views are served from the summary cache, in memory or on disk
+        self.assertEqual(
+            self.getImpl().compute_summary_from_pangenome2(self.getContext(), params)[0], ret)
+        indexer = self.getImpl().indexer
+        indexer.summary_cache.summaries = LRUCache(10)
+        self.assertEqual(
+            indexer.compute_summary_from_pangenome2(self.getContext()['token'], ref), ret)
+        summary_files = [name for name in os.listdir(indexer.summary_cache_dir)
+                         if name.endswith("_summary.json.gz")]
+        self.assertTrue(summary_files)
+
+    def test_fetch_pangenome_summary_batched_infos(self):
+        # one get_object_info3 call per genome gives the same summary
+        ref = "51489/10/1"
+        ret = fetch_pangenome_summary(ref, self.wsURL, self.getContext()['token'],
+                                      info_batch_size=1, info_concurrency=2)
+        with open(os.path.join(_TEST_DIR, "data", "summary2_expected_51489-10-1.json")) as fd:
+            expected = json.load(fd)
+        self.assertEqual(ret, expected)
+
     def test_compute_summary_from_pangenome2_invalid_aprams(self):
         params = ({"pangenome_ref": 0}, None, {"xyz": 123})
         ctx = self.getContext()
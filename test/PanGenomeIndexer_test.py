@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PanGenomeAPI.PanGenomeIndexer import PanGenomeIndexer
+from PanGenomeAPI.TableIndexer import TableIndexer
+
+_GENOMES = {'1/10/1': [{'id': 'g1', 'function': 'Serine kinase'},
+                       {'id': 'g2', 'function': ''},
+                       {'id': 'g3'}],
+            '1/11/1': [{'id': 'h1', 'function': 'ABC transporter'},
+                       {'id': 'h2', 'function': 'Ribosomal protein L7'}],
+            # not one of the genome_refs of the pangenome
+            '1/12/1': [{'id': 'k1', 'function': 'DNA gyrase'}]}
+_ORTHOLOGS = [{'id': 'fam1', 'type': 'ortholog', 'function': 'kinase', 'md5': 'md5_1',
+               'protein_translation': 'MKV',
+               'orthologs': [['g1', 1.0, '1/10/1'], ['h1', 0.5, '1/11/1']]},
+              {'id': 'fam2', 'type': 'ortholog', 'function': '', 'md5': 'md5_2',
+               'protein_translation': 'MAL',
+               'orthologs': [['g2', 1.0, '1/10/1'], ['missing', 0.2, '1/10/1'],
+                             ['g3', 0.3, '1/10/1'], ['k1', 0.7, '1/12/1']]},
+              {'id': 'fam3', 'type': 'ortholog', 'function': 'transporter', 'md5': 'md5_3',
+               'protein_translation': '', 'orthologs': []}]
+
+
+class _FakeWorkspace:
+
+    def __init__(self, url, token=None):
+        pass
+
+    def get_objects2(self, params):
+        return {'data': [{'data': {'genome_refs': ['1/10/1', '1/11/1']}}]}
+
+
+class _FakeStreamingWorkspace:
+
+    def __init__(self, url, token=None):
+        pass
+
+    def iter_object_items(self, ref, field, included=None):
+        for ortholog in _ORTHOLOGS:
+            yield {key: (list(map(list, value)) if key == 'orthologs' else value)
+                   for key, value in ortholog.items()}
+
+    def iter_objects(self, objects):
+        for object_spec in objects:
+            yield {'features': _GENOMES[object_spec['ref']]}
+
+
+class _FakeChecksumCache:
+
+    def get_checksums(self, ws, token, refs):
+        return ['chsum_' + ref.replace('/', '_') for ref in refs]
+
+    def get_checksum(self, ws, token, ref):
+        return self.get_checksums(ws, token, [ref])[0]
+
+
+class PanGenomeIndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        for target, new in (('PanGenomeAPI.PanGenomeIndexer.Workspace', _FakeWorkspace),
+                            ('PanGenomeAPI.TableIndexer.Workspace', _FakeWorkspace),
+                            ('PanGenomeAPI.PanGenomeIndexer.StreamingWorkspace',
+                             _FakeStreamingWorkspace),
+                            ('PanGenomeAPI.TableIndexer.StreamingWorkspace',
+                             _FakeStreamingWorkspace)):
+            patcher = mock.patch(target, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(TableIndexer, 'checksum_cache', _FakeChecksumCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.indexer = PanGenomeIndexer({'workspace-url': 'http://localhost',
+                                         'pangenome-index-dir': data_dir + '/pangenome_index',
+                                         'comparison-genome-index-dir':
+                                             data_dir + '/comparison_genome_index',
+                                         'genome-index-batch-size': '1'})
+
+    def test_ortholog_functions(self):
+        expected = {'fam1': [['g1', 1.0, '1/10/1', 'Serine kinase'],
+                             ['h1', 0.5, '1/11/1', 'ABC transporter']],
+                    'fam2': [['g2', 1.0, '1/10/1', None], ['missing', 0.2, '1/10/1', None],
+                             ['g3', 0.3, '1/10/1', None], ['k1', 0.7, '1/12/1', 'DNA gyrase']],
+                    # an empty field comes back as None, like every empty column
+                    'fam3': None}
+        # the first search builds the index, the second one reads it back
+        for _ in range(2):
+            ret = self.indexer.search_orthologs_from_pangenome(None, '1/1/1', '', None, 0, 10,
+                                                               None)
+            self.assertEqual(ret['num_found'], 3)
+            self.assertEqual({ortholog['id']: ortholog['orthologs']
+                              for ortholog in ret['orthologs']}, expected)
+            for ortholog in ret['orthologs']:
+                self.assertNotIn('ortholog_functions', ortholog)
+
+    def test_query_ortholog_functions(self):
+        ret = self.indexer.search_orthologs_from_pangenome(None, '1/1/1', 'kinase', None, 0,
+                                                           10, None)
+        self.assertEqual([ortholog['orthologs'] for ortholog in ret['orthologs']],
+                         [[['g1', 1.0, '1/10/1', 'Serine kinase'],
+                           ['h1', 0.5, '1/11/1', 'ABC transporter']]])
+
+
+if __name__ == '__main__':
+    unittest.main()
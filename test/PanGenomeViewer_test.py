@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import itertools
+import random
+import unittest
+
+from PanGenomeAPI.PanGenomeViewer import PanGenomeViewer
+
+
+class PanGenomeViewerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.viewer = PanGenomeViewer('1/1/1', None, 'http://localhost')
+
+    def test_compute_result_map(self):
+        # families: famA in genomes 1, 2 and 3, famB in 1 and 2, famC twice in 3,
+        # famD and famE are singletons of genomes 4 and 1
+        gene_genome_map = {'a1': '1/1/1', 'a2': '1/2/1', 'a3': '1/3/1', 'b1': '1/1/1',
+                           'b2': '1/2/1', 'c3': '1/3/1', 'c3x': '1/3/1'}
+        ortholog_gene_map = {'famA': ['a1', 'a2', 'a3'], 'famB': ['b1', 'b2', 'b2'],
+                             'famC': ['c3', 'c3x']}
+        family_map = {'famA': True, 'famB': True, 'famC': True, 'famD': False, 'famE': False}
+        gene_map = {gene_id: True for gene_id in gene_genome_map}
+        gene_map.update({'d4': False, 'e1': False})
+        genome_map = {'1/1/1': {'a1': True, 'b1': True, 'e1': False},
+                      '1/2/1': {'a2': True, 'b2': True},
+                      '1/3/1': {'a3': True, 'c3': True, 'c3x': True},
+                      '1/4/1': {'d4': False}}
+        genome_ortholog_map = {'1/1/1': 2, '1/2/1': 2, '1/3/1': 2, '1/4/1': 0}
+        genome_ref_name_map = {'1/1/1': 'E. coli (1/1/1)', '1/2/1': 'E. coli (1/2/1)',
+                               '1/3/1': 'B. subtilis', '1/4/1': 'genome4'}
+
+        ret = self.viewer._compute_result_map('pg1', genome_map, gene_map, family_map,
+                                              genome_ortholog_map, genome_ref_name_map,
+                                              ortholog_gene_map, gene_genome_map)
+
+        # output of the implementation that copied a dict per genome and family
+        expected = {
+            'pangenome_id': 'pg1',
+            'genomes_count': 4,
+            'genes': {'genes_count': 9, 'homolog_family_genes_count': 7,
+                      'singleton_family_genes_count': 2},
+            'families': {'families_count': 5, 'homolog_families_count': 3,
+                         'singleton_families_count': 2},
+            'genomes': {
+                'E. coli (1/1/1)': {'genome_genes': 3, 'genome_homolog_family_genes': 2,
+                                    'genome_homolog_family': 2,
+                                    'genome_singleton_family_genes': 1},
+                'E. coli (1/2/1)': {'genome_genes': 2, 'genome_homolog_family_genes': 2,
+                                    'genome_homolog_family': 2,
+                                    'genome_singleton_family_genes': 0},
+                'B. subtilis': {'genome_genes': 3, 'genome_homolog_family_genes': 3,
+                                'genome_homolog_family': 2,
+                                'genome_singleton_family_genes': 0},
+                'genome4': {'genome_genes': 1, 'genome_homolog_family_genes': 0,
+                            'genome_homolog_family': 0,
+                            'genome_singleton_family_genes': 1}},
+            'shared_family_map': {
+                'E. coli (1/1/1)': {'E. coli (1/1/1)': 2, 'E. coli (1/2/1)': 2,
+                                    'B. subtilis': 1, 'genome4': 0},
+                'E. coli (1/2/1)': {'E. coli (1/1/1)': 2, 'E. coli (1/2/1)': 2,
+                                    'B. subtilis': 1, 'genome4': 0},
+                'B. subtilis': {'E. coli (1/1/1)': 1, 'E. coli (1/2/1)': 1,
+                                'B. subtilis': 2, 'genome4': 0},
+                'genome4': {'E. coli (1/1/1)': 0, 'E. coli (1/2/1)': 0,
+                            'B. subtilis': 0, 'genome4': 0}},
+            'genome_ref_name_map': genome_ref_name_map}
+        self.assertEqual(ret, expected)
+        genome_names = list(genome_ref_name_map.values())
+        self.assertEqual(list(ret['shared_family_map']), genome_names)
+        for genome_family_map in ret['shared_family_map'].values():
+            self.assertEqual(list(genome_family_map), genome_names)
+
+    def test_shared_family_map_random(self):
+        rnd = random.Random(42)
+        genome_refs = ['1/{}/1'.format(pos + 1) for pos in range(30)]
+        gene_genome_map = {}
+        ortholog_gene_map = {}
+        for family_pos in range(500):
+            family_id = 'fam{}'.format(family_pos)
+            members = rnd.sample(genome_refs, rnd.randint(1, len(genome_refs)))
+            gene_ids = []
+            for genome_ref in members:
+                gene_id = '{}_{}'.format(family_id, genome_ref)
+                gene_genome_map[gene_id] = genome_ref
+                gene_ids.extend([gene_id] * rnd.randint(1, 2))
+            # genes missing from every genome are ignored
+            gene_ids.append(family_id + '_unknown')
+            ortholog_gene_map[family_id] = gene_ids
+        genome_map = {genome_ref: {gene_id: True for gene_id, gene_genome_ref
+                                   in gene_genome_map.items() if gene_genome_ref == genome_ref}
+                      for genome_ref in genome_refs}
+        family_genomes = {family_id: {gene_genome_map[gene_id] for gene_id in gene_ids
+                                      if gene_id in gene_genome_map}
+                          for family_id, gene_ids in ortholog_gene_map.items()}
+        genome_ortholog_map = {genome_ref: sum(genome_ref in genomes
+                                               for genomes in family_genomes.values())
+                               for genome_ref in genome_refs}
+        genome_ref_name_map = {genome_ref: 'genome ' + genome_ref for genome_ref in genome_refs}
+        gene_map = {gene_id: True for gene_id in gene_genome_map}
+        family_map = {family_id: True for family_id in ortholog_gene_map}
+
+        ret = self.viewer._compute_result_map('pg', genome_map, gene_map, family_map,
+                                              genome_ortholog_map, genome_ref_name_map,
+                                              ortholog_gene_map, gene_genome_map)
+
+        shared_family_map = ret['shared_family_map']
+        for genome_ref, other_genome_ref in itertools.product(genome_refs, repeat=2):
+            if genome_ref == other_genome_ref:
+                expected = genome_ortholog_map[genome_ref]
+            else:
+                expected = sum(genome_ref in genomes and other_genome_ref in genomes
+                               for genomes in family_genomes.values())
+            self.assertEqual(shared_family_map[genome_ref_name_map[genome_ref]]
+                             [genome_ref_name_map[other_genome_ref]], expected)
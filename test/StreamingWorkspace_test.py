@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import unittest
+from unittest import mock
+
+from PanGenomeAPI.StreamingWorkspace import StreamingWorkspace
+from installed_clients.baseclient import ServerError
+
+
+class _FakeResponse:
+
+    def __init__(self, body):
+        self.status_code = 200
+        self.ok = True
+        self.headers = {'content-type': 'application/json'}
+        self.raw = io.BytesIO(json.dumps(body).encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class StreamingWorkspaceTest(unittest.TestCase):
+
+    def stream(self, body, method, *args):
+        session = mock.Mock()
+        session.post.return_value = _FakeResponse(body)
+        with mock.patch('PanGenomeAPI.StreamingWorkspace.get_session', lambda: session):
+            return list(getattr(StreamingWorkspace('http://localhost'), method)(*args))
+
+    def test_items(self):
+        body = {'version': '1.1',
+                'result': [{'data': [{'data': {'orthologs': [{'id': 'fam1'}, {'id': 'fam2'}],
+                                               'name': 'pg'}}]}]}
+        self.assertEqual(self.stream(body, 'iter_object_items', '1/2/3', 'orthologs'),
+                         [{'id': 'fam1'}, {'id': 'fam2'}])
+        self.assertEqual(self.stream(body, 'iter_objects', [{'ref': '1/2/3'}]),
+                         [body['result'][0]['data'][0]['data']])
+        body['result'][0]['data'][0]['data']['orthologs'] = []
+        self.assertEqual(self.stream(body, 'iter_object_items', '1/2/3', 'orthologs'), [])
+
+    def test_error_in_successful_response(self):
+        body = {'version': '1.1', 'error': {'name': 'JSONRPCError', 'code': -32500,
+                                            'message': 'Object 3 cannot be accessed',
+                                            'error': 'traceback'}}
+        for method, args in (('iter_object_items', ('1/2/3', 'orthologs')),
+                             ('iter_objects', ([{'ref': '1/2/3'}],))):
+            with self.subTest(method=method):
+                with self.assertRaisesRegex(ServerError, 'Object 3 cannot be accessed'):
+                    self.stream(body, method, *args)
+
+    def test_missing_field(self):
+        body = {'version': '1.1', 'result': [{'data': [{'data': {'name': 'pg'}}]}]}
+        with self.assertRaisesRegex(ServerError, 'orthologs'):
+            self.stream(body, 'iter_object_items', '1/2/3', 'orthologs')
+        with self.assertRaises(ServerError):
+            self.stream({'version': '1.1'}, 'iter_objects', [{'ref': '1/2/3'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
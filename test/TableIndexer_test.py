@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PanGenomeAPI.ChecksumCache import ChecksumCache
+from PanGenomeAPI.LRUCache import LRUCache
+from PanGenomeAPI.TableIndexer import TableIndexer
+
+_INFO_INCLUDED = ['id', 'type', 'function', 'md5']
+_FUNCTIONS = ['ABC transporter ATP-binding protein', 'abc Transporter permease',
+              'Serine/threonine-protein kinase', 'DNA-binding response regulator',
+              'hypothetical protein', 'Ab initio predicted protein', 'tRNA ligase, ATP',
+              'Émile protein Σ', '',
+              # has every 3-gram of "transporter" but not the word
+              'Transport of ABC porter']
+
+
+class _FakeWorkspace:
+
+    def __init__(self, url, token=None):
+        pass
+
+    def get_object_info3(self, params):
+        return {'infos': [[1, 'obj', 'KBaseGenomes.Pangenome-4.0', '', 1, 'user', 1, 'ws',
+                           'chsum' + obj['ref'].replace('/', '_'), 1, {}]
+                          for obj in params['objects']]}
+
+
+def _set_up_indexer(test, compression='none'):
+    test.index_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, test.index_dir)
+    patcher = mock.patch('PanGenomeAPI.TableIndexer.Workspace', _FakeWorkspace)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    # fresh process-wide caches, the tests all search the same ref
+    for name, cache in (('num_found_cache', LRUCache(10000)),
+                        ('checksum_cache', ChecksumCache())):
+        patcher = mock.patch.object(TableIndexer, name, cache)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return TableIndexer(None, 'http://localhost', compression)
+
+
+class TableIndexerTest(unittest.TestCase):
+
+    COMPRESSION = 'none'
+
+    def setUp(self):
+        self.indexer = _set_up_indexer(self, self.COMPRESSION)
+        rnd = random.Random(5)
+        self.rows = [{'id': f'Fam{pos}_{rnd.choice("aAbB")}',
+                      'type': rnd.choice(['Ortholog', 'ortholog', None]),
+                      'function': rnd.choice(_FUNCTIONS), 'md5': '%08x' % rnd.getrandbits(32)}
+                     for pos in range(500)]
+        self.indexer.save_object_index(iter(self.rows), 'chsum1_1_1', _INFO_INCLUDED, (),
+                                       self.index_dir, '_orthologs')
+
+    def search(self, query, start, limit, num_found=None):
+        return self.indexer.run_search('1/1/1', self.index_dir, '_orthologs', 'orthologs',
+                                       _INFO_INCLUDED, query, None, start, limit, num_found,
+                                       False)
+
+    def brute_force(self, query):
+        words = self.indexer.get_query_words(query)
+        ret = []
+        for row in self.rows:
+            line = '\t'.join(self.indexer.to_text(row, info) for info in _INFO_INCLUDED)
+            if all(word in line.lower() for word in words):
+                ret.append(row['id'])
+        return ret
+
+    def result_files(self):
+        return [name for name in os.listdir(self.index_dir) if name.endswith('.rows')]
+
+    def check_queries(self):
+        queries = ['', 'a', 'AB', 'abc', 'ATP', 'fam1', 'Fam12_a', 'transporter',
+                   'ABC Transporter', 'transporter abc', 'ab prot', 'atp, abc', 'protein kinase',
+                   'ortholog ab', 'émile σ', 'serine/threonine', 'nothing here', 'fam4 zz',
+                   '1a1a', '0f0f0', 'B0a']
+        for query in queries:
+            expected = self.brute_force(query)
+            for start, limit in [(0, 10), (0, 1000), (25, 40)]:
+                with self.subTest(query=query, start=start, limit=limit):
+                    ret = self.search(query, start, limit)
+                    self.assertEqual(ret['num_found'], len(expected))
+                    self.assertEqual([obj['id'] for obj in ret['orthologs']],
+                                     expected[start:start + limit])
+
+    def test_search_matches_brute_force(self):
+        # pages within max_top_k_size rows never save the matching rows
+        self.check_queries()
+        self.assertEqual(self.result_files(), [])
+
+    def test_saved_search_matches_brute_force(self):
+        self.indexer.max_top_k_size = 20
+        self.check_queries()
+        self.assertNotEqual(self.result_files(), [])
+
+    def test_search_with_known_num_found(self):
+        # pages of a search whose count the caller already knows stop checking
+        # rows against their text once the page is filled
+        for query in ['ab prot', 'fam1', 'transporter ATP']:
+            expected = self.brute_force(query)
+            for start, limit in [(0, 5), (10, 20)]:
+                with self.subTest(query=query, start=start, limit=limit):
+                    ret = self.search(query, start, limit, len(expected))
+                    self.assertEqual(ret['num_found'], len(expected))
+                    self.assertEqual([obj['id'] for obj in ret['orthologs']],
+                                     expected[start:start + limit])
+
+
+class StructuredColumnTest(unittest.TestCase):
+
+    ROWS = [{'id': 'fam1', 'orthologs': [['g1|ref|YP_1.1|', 1.0, '1/10/1']],
+             'genome_features': {'1/10/1': [['f1', [1, 2], 0.1]]},
+             'genome_similarity': {'1/10/1': [1, 3]}},
+            {'id': 'fam2', 'orthologs': [['g2', 0.30000000000000004, '1/10/1'],
+                                         ['g3 "É"', 1e-05, '1/11/1'], ['g4', 2, '1/12/1']],
+             'genome_features': {'1/10/1': [['f2', [], 0.5]], '1/11/1': []},
+             'genome_similarity': {'1/10/1': [2, 3], '1/11/1': [0, 0]}}]
+
+    def setUp(self):
+        self.indexer = _set_up_indexer(self)
+
+    def legacy_decode(self, row, info):
+        # how the search methods decoded the text of these columns before
+        value = eval(self.indexer.to_text(row, info))
+        if info == 'orthologs':
+            value = list(value)
+            if not isinstance(value[0], list):
+                value = [value]
+        return value
+
+    def test_decode_matches_eval(self):
+        for info in ('orthologs', 'genome_features', 'genome_similarity'):
+            self.indexer.save_object_index(iter(self.ROWS), 'chsum1_1_1', ['id', info], [info],
+                                           self.index_dir, '_' + info)
+            ret = self.indexer.run_search('1/1/1', self.index_dir, '_' + info, 'items',
+                                          ['id', info], '', None, 0, 10, None, False, [info])
+            self.assertEqual(len(ret['items']), len(self.ROWS))
+            for row, obj in zip(self.ROWS, ret['items']):
+                with self.subTest(info=info, id=row['id']):
+                    self.assertEqual(obj[info], self.legacy_decode(row, info))
+
+
+class CompressedTableIndexerTest(TableIndexerTest):
+
+    # rows are read back from several compressed blocks of each column
+    COMPRESSION = 'gzip'
+
+
+class TableIndexerSortTest(unittest.TestCase):
+
+    # orders of "LC_ALL=C sort -f -t\t -k..." over the rows, which is how
+    # searches used to be sorted: descending keys don't inherit the global -f
+    # and compare bytes, ties fall back to the whole row in byte order
+    EXPECTED = [([['id', 1]], ['A', 'a', 'Ab', 'aB', 'ab', 'B', 'b', 'C', 'c', '_x']),
+                ([['id', 0]], ['c', 'b', 'ab', 'aB', 'a', '_x', 'C', 'B', 'Ab', 'A']),
+                ([['function', 1], ['id', 0]],
+                 ['ab', 'a', '_x', 'A', 'b', 'aB', 'B', 'Ab', 'c', 'C']),
+                ([['function', 0], ['id', 1]],
+                 ['C', 'aB', 'B', 'A', '_x', 'c', 'Ab', 'b', 'a', 'ab']),
+                ([['function', 0], ['id', 0]],
+                 ['C', 'aB', 'B', '_x', 'A', 'c', 'b', 'Ab', 'ab', 'a'])]
+
+    def setUp(self):
+        self.indexer = _set_up_indexer(self)
+        rows = [('b', 'Kinase'), ('B', 'kinase'), ('a', 'ATPase'), ('A', 'atpase'),
+                ('Ab', 'Kinase'), ('aB', 'kinase'), ('c', 'Zinc finger'), ('_x', 'atpase'),
+                ('C', 'zinc finger'), ('ab', 'ATPase')]
+        self.indexer.save_object_index(({'id': row_id, 'function': function}
+                                        for row_id, function in rows),
+                                       'chsum1_1_1', ['id', 'function'], (), self.index_dir,
+                                       '_orthologs')
+
+    def search(self, sort_by, start, limit):
+        ret = self.indexer.run_search('1/1/1', self.index_dir, '_orthologs', 'orthologs',
+                                      ['id', 'function'], '', sort_by, start, limit, None,
+                                      False)
+        return [obj['id'] for obj in ret['orthologs']]
+
+    def check_orders(self):
+        for sort_by, expected in self.EXPECTED:
+            for start, limit in [(0, 4), (3, 4), (0, 10)]:
+                with self.subTest(sort_by=sort_by, start=start, limit=limit):
+                    self.assertEqual(self.search(sort_by, start, limit),
+                                     expected[start:start + limit])
+
+    def test_top_k_order(self):
+        self.check_orders()
+
+    def test_stored_order(self):
+        # every sort column is fully sorted and saved before it is used
+        self.indexer.max_top_k_size = 0
+        self.check_orders()
+
+
+if __name__ == '__main__':
+    unittest.main()
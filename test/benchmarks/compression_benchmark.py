@@ -0,0 +1,119 @@
+"""
+Compare the search index codecs (none, gzip, zstd, lz4) on an orthologs table
+made of the proteins of the test pangenome genomes (test/data/*.faa), repeated
+up to num_rows families: time to build the index, size of the index file,
+throughput of a full scan of every column (open + decode every row), which is
+what an uncached query with long words costs, and latency of warm 10-row pages
+(first page, first page of a query, page in the middle of the table), which is
+what most searches cost.
+Run with lib/ on the PYTHONPATH:
+    PYTHONPATH=lib python test/benchmarks/compression_benchmark.py [num_rows]
+"""
+import glob
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from PanGenomeAPI.ColumnarIndex import ColumnarIndex
+from PanGenomeAPI.TableIndexer import TableIndexer
+
+INFO_INCLUDED = ['id', 'type', 'function', 'md5', 'protein_translation', 'orthologs']
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+_CHSUM = "chsum_bench"
+_PAGE_REPEATS = 50
+
+
+class _FakeWorkspace:
+
+    def __init__(self, url, token=None):
+        pass
+
+    def get_object_info3(self, params):
+        return {'infos': [[1, 'obj', 'KBaseGenomes.Pangenome-4.0', '', 1, 'user', 1, 'ws',
+                           _CHSUM, 1, {}] for _ in params['objects']]}
+
+
+def _read_proteins() -> list:
+    ret = []
+    for faa_file in sorted(glob.glob(os.path.join(_DATA_DIR, "*.faa"))):
+        with open(faa_file) as f:
+            for record in f.read().split(">")[1:]:
+                header, *sequence = record.split("\n")
+                gene_id, _, function = header.partition(" ")
+                ret.append((gene_id, function, "".join(sequence)))
+    return ret
+
+
+def _make_orthologs(num_rows: int, rnd: random.Random) -> list:
+    proteins = _read_proteins()
+    ret = []
+    for i in range(num_rows):
+        gene_id, function, sequence = proteins[i % len(proteins)]
+        num_genes = rnd.randint(1, 20)
+        ret.append({"id": f"{gene_id}_{i}", "type": "ortholog", "function": function,
+                    "md5": "%032x" % rnd.getrandbits(128),
+                    "protein_translation": sequence,
+                    "orthologs": [[f"{rnd.choice(proteins)[0]}_{rnd.randint(1, 5000)}",
+                                   rnd.random(), f"51489/{rnd.randint(1, 50)}/1"]
+                                  for _ in range(num_genes)]})
+    return ret
+
+
+def _page_time(indexer: TableIndexer, index_dir: str, query: str, start: int) -> float:
+    def search():
+        indexer.run_search("1/1/1", index_dir, "_orthologs", "orthologs", INFO_INCLUDED,
+                           query, None, start, 10, None, False, ["orthologs"])
+
+    # the first call builds the query index and caches the checksum and count
+    search()
+    times = []
+    for _ in range(_PAGE_REPEATS):
+        begin = time.perf_counter()
+        search()
+        times.append(time.perf_counter() - begin)
+    return statistics.median(times)
+
+
+def _bench(codec: str, rows: list, index_dir: str) -> None:
+    indexer = TableIndexer(None, "http://localhost", codec)
+    start = time.perf_counter()
+    indexer.save_object_index(iter(rows), _CHSUM, INFO_INCLUDED, ['orthologs'],
+                              index_dir, "_orthologs")
+    build_time = time.perf_counter() - start
+    index_file = indexer.get_index_file(_CHSUM, index_dir, "_orthologs")
+    size = os.path.getsize(index_file)
+
+    start = time.perf_counter()
+    with ColumnarIndex(index_file) as index:
+        columns = [index.column(col) for col in index.meta["columns"]]
+        scanned = 0
+        for column in columns:
+            for row in range(len(column)):
+                scanned += len(column[row])
+    scan_time = time.perf_counter() - start
+
+    with mock.patch("PanGenomeAPI.TableIndexer.Workspace", _FakeWorkspace):
+        pages = [_page_time(indexer, index_dir, "", 0),
+                 _page_time(indexer, index_dir, "kinase", 0),
+                 _page_time(indexer, index_dir, "", len(rows) // 2)]
+    for name in os.listdir(index_dir):
+        os.remove(os.path.join(index_dir, name))
+    print(f"{codec:<6} build: {build_time:7.2f} s   size: {size / 2**20:8.2f} MiB   "
+          f"scan: {len(rows) / scan_time:10.0f} rows/s   page (first / query / middle): "
+          + " / ".join(f"{page * 1000:.2f}" for page in pages) + " ms")
+
+
+if __name__ == "__main__":
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rows = _make_orthologs(num_rows, random.Random(42))
+    index_dir = tempfile.mkdtemp()
+    try:
+        for codec in ("none", "gzip", "zstd", "lz4"):
+            _bench(codec, rows, index_dir)
+    finally:
+        shutil.rmtree(index_dir)
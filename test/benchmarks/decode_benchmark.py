@@ -0,0 +1,48 @@
+"""
+Compare the per-row cost of decoding the nested search columns (orthologs,
+genome_features) from the eval()-ed text the indexes used to store with the
+JSON encoding stored now.
+Run with lib/ on the PYTHONPATH:
+    PYTHONPATH=lib python test/benchmarks/decode_benchmark.py
+"""
+import json
+import random
+import timeit
+
+from PanGenomeAPI.TableIndexer import TableIndexer
+
+
+def _make_orthologs(num_genes: int, rnd: random.Random) -> dict:
+    return {"orthologs": [[f"gi|{rnd.randint(10**8, 10**9)}|ref|YP_{i}.1|",
+                           rnd.random(), f"51489/{rnd.randint(1, 500)}/1"]
+                          for i in range(num_genes)]}
+
+
+def _make_genome_features(num_genomes: int, rnd: random.Random) -> dict:
+    return {"genome_features": {f"51489/{g}/1": [[f"feature_{g}_{i}", [1, 2], rnd.random()]
+                                                 for i in range(3)]
+                                for g in range(num_genomes)}}
+
+
+def _bench(label: str, rows: list, key: str, repeat: int = 5) -> None:
+    indexer = TableIndexer(None, None)
+    texts = [indexer.to_text(row, key) for row in rows]
+    encoded = [indexer.to_json(row, key) for row in rows]
+    eval_time = min(timeit.repeat(lambda: [eval(text) for text in texts],
+                                  number=1, repeat=repeat))
+    json_time = min(timeit.repeat(lambda: [json.loads(data) for data in encoded],
+                                  number=1, repeat=repeat))
+    per_row = 1e6 / len(rows)
+    print(f"{label:<34} eval: {eval_time * per_row:8.1f} us/row   "
+          f"json: {json_time * per_row:8.1f} us/row   "
+          f"speedup: {eval_time / json_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    rnd = random.Random(42)
+    for num_genes in (2, 20, 200):
+        rows = [_make_orthologs(num_genes, rnd) for _ in range(1000)]
+        _bench(f"orthologs ({num_genes} genes)", rows, "orthologs")
+    for num_genomes in (2, 20, 200):
+        rows = [_make_genome_features(num_genomes, rnd) for _ in range(1000)]
+        _bench(f"genome_features ({num_genomes} genomes)", rows, "genome_features")
@@ -0,0 +1,71 @@
+"""
+Compare the shared homolog family computation of the pangenome summary
+(PanGenomeViewer._compute_result_map) with the previous implementation, which
+copied a per-genome dict for every genome of every family and rebuilt the
+genome list inside the gene loop, on synthetic pangenomes of 100+ genomes.
+Run with lib/ on the PYTHONPATH:
+    PYTHONPATH=lib python test/benchmarks/shared_family_benchmark.py
+"""
+import random
+import time
+
+from PanGenomeAPI.PanGenomeViewer import PanGenomeViewer
+
+
+def _legacy_shared_family_map(genome_refs, ortholog_gene_map, gene_genome_map):
+    init_map = {genome_ref: 0 for genome_ref in genome_refs}
+    shared_family_map = {genome_ref: init_map for genome_ref in genome_refs}
+    for ortholog_id, gene_ids in ortholog_gene_map.items():
+        shared_family_genome_refs = []
+        for gene_id in list(set(gene_ids)):
+            shared_family_genome_refs.append(gene_genome_map.get(gene_id))
+            shared_family_genome_refs = [i for i in shared_family_genome_refs if i is not None]
+        shared_family_genome_refs = list(set(shared_family_genome_refs))
+        for shared_family_genome_ref in shared_family_genome_refs:
+            shared_family_genome_map = shared_family_map.get(shared_family_genome_ref).copy()
+            for shared_family_genome_ref_copy in shared_family_genome_refs:
+                if shared_family_genome_ref_copy != shared_family_genome_ref:
+                    shared_family_genome_map[shared_family_genome_ref_copy] += 1
+            shared_family_map.update({shared_family_genome_ref: shared_family_genome_map})
+    return shared_family_map
+
+
+def _make_pangenome(num_genomes: int, num_families: int, rnd: random.Random) -> tuple:
+    genome_refs = [f"1/{pos + 1}/1" for pos in range(num_genomes)]
+    gene_genome_map = {}
+    ortholog_gene_map = {}
+    for family_pos in range(num_families):
+        # mostly small accessory families plus a core shared by most genomes
+        size = num_genomes if family_pos % 5 == 0 else rnd.randint(2, max(2, num_genomes // 10))
+        gene_ids = []
+        for genome_ref in rnd.sample(genome_refs, size):
+            gene_id = f"fam{family_pos}_{genome_ref}"
+            gene_genome_map[gene_id] = genome_ref
+            gene_ids.append(gene_id)
+        ortholog_gene_map[f"fam{family_pos}"] = gene_ids
+    return genome_refs, ortholog_gene_map, gene_genome_map
+
+
+def _bench(num_genomes: int, num_families: int) -> None:
+    genome_refs, ortholog_gene_map, gene_genome_map = _make_pangenome(
+        num_genomes, num_families, random.Random(42))
+    start = time.perf_counter()
+    legacy = _legacy_shared_family_map(genome_refs, ortholog_gene_map, gene_genome_map)
+    legacy_time = time.perf_counter() - start
+    viewer = PanGenomeViewer("1/1/1", None, "http://localhost")
+    start = time.perf_counter()
+    matrix = viewer._compute_shared_family_matrix(genome_refs, ortholog_gene_map,
+                                                  gene_genome_map)
+    new_time = time.perf_counter() - start
+    for pos, genome_ref in enumerate(genome_refs):
+        for other_pos, other_genome_ref in enumerate(genome_refs):
+            if pos != other_pos:
+                assert legacy[genome_ref][other_genome_ref] == matrix[pos][other_pos]
+    print(f"{num_genomes:4d} genomes {num_families:6d} families   "
+          f"legacy: {legacy_time:8.2f} s   matrix: {new_time:6.2f} s   "
+          f"speedup: {legacy_time / new_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    for num_genomes, num_families in ((100, 5000), (100, 20000), (200, 20000)):
+        _bench(num_genomes, num_families)
@@ -0,0 +1,80 @@
+"""
+Scaling of the shared homolog family counts of fetch_pangenome_summary with the
+width of the pangenome: the nested loop over the genome pairs of every family
+and the modes of _shared_families, the dense Gram product of the family x
+genome incidence matrix, its sparse expansion into genome pairs after merging
+the identical genome sets, and their automatic combination. Every pangenome has
+a core of families in all the genomes plus accessory families of heavy-tailed
+sizes.
+Run with lib/ on the PYTHONPATH:
+    PYTHONPATH=lib python test/benchmarks/shared_family_scaling_benchmark.py
+"""
+import random
+import time
+
+import numpy as np
+
+from PanGenomeAPI.fetch_summary import main
+
+# the nested loop is skipped above this many genome pairs
+_MAX_LEGACY_PAIRS = 5 * 10 ** 7
+
+
+def _legacy_shared_families(family_genomes: list, num_genomes: int) -> np.ndarray:
+    shared = [[0] * num_genomes for _ in range(num_genomes)]
+    for genomes in family_genomes:
+        for genome1 in genomes:
+            row = shared[genome1]
+            for genome2 in genomes:
+                row[genome2] += 1
+    return np.array(shared, dtype=np.int64)
+
+
+def _make_families(num_genomes: int, num_core: int, num_accessory: int,
+                   rnd: random.Random) -> list:
+    genomes = list(range(num_genomes))
+    family_genomes = [genomes] * num_core
+    for _ in range(num_accessory):
+        size = min(num_genomes, int(rnd.paretovariate(1.1)) + 1)
+        family_genomes.append(sorted(rnd.sample(genomes, size)))
+    rnd.shuffle(family_genomes)
+    return family_genomes
+
+
+def _timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    ret = func(*args)
+    return ret, time.perf_counter() - start
+
+
+def _bench(num_genomes: int, num_core: int, num_accessory: int) -> None:
+    family_genomes = _make_families(num_genomes, num_core, num_accessory, random.Random(42))
+    incidence_families = np.repeat(np.arange(len(family_genomes)),
+                                   [len(genomes) for genomes in family_genomes])
+    incidence_genomes = np.concatenate([np.array(genomes, dtype=np.int64)
+                                        for genomes in family_genomes])
+    pairs = sum(len(genomes) ** 2 for genomes in family_genomes)
+
+    expected = None
+    times = []
+    for mode in main.SHARED_FAMILY_MODES:
+        ret, mode_time = _timed(main._shared_families, incidence_families,
+                                incidence_genomes, num_genomes, mode)
+        if expected is None:
+            expected = ret
+        assert (ret == expected).all()
+        times.append(f"{mode}: {mode_time:6.2f} s")
+    if pairs <= _MAX_LEGACY_PAIRS:
+        legacy, legacy_time = _timed(_legacy_shared_families, family_genomes, num_genomes)
+        assert (legacy == expected).all()
+        legacy = f"{legacy_time:7.2f} s"
+    else:
+        legacy = "   skipped"
+    print(f"{num_genomes:5d} genomes {len(family_genomes):6d} families "
+          f"{len(incidence_genomes):9d} non-zeros {pairs:12d} pairs   "
+          f"nested loop: {legacy}   " + "   ".join(times))
+
+
+if __name__ == "__main__":
+    for num_genomes in (100, 250, 500, 1000, 2000):
+        _bench(num_genomes, 2000, 40 * num_genomes)
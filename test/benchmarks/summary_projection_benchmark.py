@@ -0,0 +1,142 @@
+"""
+Compare the pangenome download of fetch_pangenome_summary with and without the
+"included" projection (SUMMARY_INCLUDED_PATHS), in response bytes and latency.
+The pangenomes are synthetic copies of the test pangenomes, with the family and
+gene counts of test/data/summary2_expected_*.json and family annotations and
+protein sequences of typical sizes, served by a local JSON-RPC server that
+mimics the workspace subsetting.
+Run with lib/ on the PYTHONPATH:
+    PYTHONPATH=lib python test/benchmarks/summary_projection_benchmark.py
+"""
+import glob
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PanGenomeAPI.fetch_summary import main
+from installed_clients.WorkspaceClient import Workspace
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+_AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+_REPEATS = 5
+
+
+def _make_pangenome(expected: dict, rnd: random.Random) -> dict:
+    genome_refs = list(expected["genome_ref_name_map"])
+    families = expected["families"]
+    homolog_genes = expected["genes"]["homolog_family_genes_count"]
+    # every homolog family has at least two genes, the rest is spread randomly
+    sizes = [2] * families["homolog_families_count"]
+    for _ in range(homolog_genes - 2 * len(sizes)):
+        sizes[rnd.randrange(len(sizes))] += 1
+    sizes += [1] * families["singleton_families_count"]
+    orthologs = []
+    for pos, size in enumerate(sizes):
+        protein = "".join(rnd.choice(_AMINO_ACIDS) for _ in range(rnd.randint(100, 600)))
+        orthologs.append({
+            "id": f"fam{pos}",
+            "type": "ortholog",
+            "function": "putative ABC transporter ATP-binding protein",
+            "md5": "%032x" % rnd.getrandbits(128),
+            "protein_translation": protein,
+            "orthologs": [[f"gene{pos}_{gene}", 1.0, rnd.choice(genome_refs)]
+                          for gene in range(size)]})
+    return {"id": expected["pangenome_id"], "type": "orthomcl", "name": "pangenome",
+            "genome_refs": genome_refs, "orthologs": orthologs}
+
+
+def _project(data, steps: list):
+    if not steps:
+        return data
+    if steps[0] == "[*]":
+        return [_project(value, steps[1:]) for value in data]
+    return {steps[0]: _project(data[steps[0]], steps[1:])}
+
+
+def _merge(first, second):
+    if isinstance(first, dict):
+        for key, value in second.items():
+            first[key] = _merge(first[key], value) if key in first else value
+    elif isinstance(first, list):
+        return [_merge(value, other) for value, other in zip(first, second)]
+    return first
+
+
+class _WorkspaceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    objects = {}
+    infos = {}
+    bytes_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        params = body["params"][0]
+        if body["method"] == "Workspace.get_objects2":
+            result = {"data": []}
+            for object_spec in params["objects"]:
+                data = self.objects[object_spec["ref"]]
+                if object_spec.get("included"):
+                    projected = {}
+                    for path in object_spec["included"]:
+                        projected = _merge(projected, _project(data, path.split("/")[1:]))
+                    data = projected
+                result["data"].append({"data": data})
+        else:
+            result = {"infos": [self.infos[object_spec["ref"]]
+                                for object_spec in params["objects"]]}
+        out = json.dumps({"version": "1.1", "id": body["id"], "result": [result]}).encode()
+        _WorkspaceHandler.bytes_sent += len(out)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+
+def _timed_bytes(func, *args) -> tuple:
+    times = []
+    for _ in range(_REPEATS):
+        _WorkspaceHandler.bytes_sent = 0
+        start = time.perf_counter()
+        ret = func(*args)
+        times.append(time.perf_counter() - start)
+    return ret, _WorkspaceHandler.bytes_sent, min(times)
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WorkspaceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    rnd = random.Random(42)
+    for path in sorted(glob.glob(os.path.join(_DATA_DIR, "summary2_expected_*.json"))):
+        with open(path) as fd:
+            expected = json.load(fd)
+        ref = os.path.basename(path)[len("summary2_expected_"):-len(".json")].replace("-", "/")
+        _WorkspaceHandler.objects[ref] = _make_pangenome(expected, rnd)
+        for genome_ref, name in expected["genome_ref_name_map"].items():
+            genes = expected["genomes"][name]["genome_genes"]
+            ws_id, obj_id, ver = (int(part) for part in genome_ref.split("/"))
+            _WorkspaceHandler.infos[genome_ref] = [
+                obj_id, f"genome{obj_id}", "KBaseGenomes.Genome-17.0", "", ver, "user", ws_id,
+                "ws", "chsum", 1, {"Name": name, "Number of Protein Encoding Genes": str(genes)}]
+
+        ws = Workspace(url)
+        _, full_bytes, full_time = _timed_bytes(ws.get_objects2, {"objects": [{"ref": ref}]})
+        _, projected_bytes, projected_time = _timed_bytes(ws.get_objects2, {"objects": [
+            {"ref": ref, "included": main.SUMMARY_INCLUDED_PATHS}]})
+        summary, summary_bytes, summary_time = _timed_bytes(
+            main.fetch_pangenome_summary, ref, url, None)
+        for key in ("genomes_count", "genes", "families", "genome_ref_name_map"):
+            assert summary[key] == expected[key]
+        print(f"{ref}: full pangenome {full_bytes / 1e6:6.2f} MB {full_time * 1000:7.1f} ms   "
+              f"projected {projected_bytes / 1e6:6.2f} MB {projected_time * 1000:7.1f} ms   "
+              f"({full_bytes / projected_bytes:4.1f}x fewer bytes, "
+              f"{full_time / projected_time:4.1f}x faster)   "
+              f"summary: {summary_bytes / 1e6:6.2f} MB {summary_time * 1000:7.1f} ms")
+    server.shutdown()
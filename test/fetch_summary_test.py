@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from PanGenomeAPI.fetch_summary import main
+
+_NUM_GENOMES = 40
+
+
+def _nested_loop(family_genomes, num_genomes):
+    shared = [[0] * num_genomes for _ in range(num_genomes)]
+    for genomes in family_genomes:
+        for genome1 in genomes:
+            for genome2 in genomes:
+                shared[genome1][genome2] += 1
+    return shared
+
+
+class SharedFamiliesTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(3)
+        genomes = list(range(_NUM_GENOMES))
+        large = sorted(rnd.sample(genomes, main._MERGE_MIN_SIZE + 4))
+        # core families and repeated large sets are merged, the other large
+        # sets and the small ones (singletons included) are kept as they are
+        self.family_genomes = [genomes] * 5 + [large] * 3
+        self.family_genomes += [sorted(rnd.sample(genomes, main._MERGE_MIN_SIZE + 1))
+                                for _ in range(4)]
+        self.family_genomes += [sorted(rnd.sample(genomes, rnd.randint(1, 10)))
+                                for _ in range(60)]
+        rnd.shuffle(self.family_genomes)
+
+    def shared_families(self, mode):
+        incidence_families = np.repeat(np.arange(len(self.family_genomes)),
+                                       [len(genomes) for genomes in self.family_genomes])
+        incidence_genomes = np.concatenate([np.array(genomes, dtype=np.int64)
+                                            for genomes in self.family_genomes])
+        return main._shared_families(incidence_families, incidence_genomes, _NUM_GENOMES,
+                                     mode).tolist()
+
+    def test_modes_match_nested_loop(self):
+        expected = _nested_loop(self.family_genomes, _NUM_GENOMES)
+        for mode in main.SHARED_FAMILY_MODES:
+            with self.subTest(mode=mode):
+                self.assertEqual(self.shared_families(mode), expected)
+            # several blocks of families and chunks of genome pairs
+            with self.subTest(mode=mode, blocks=True), \
+                    mock.patch.object(main, '_FAMILY_BLOCK_SIZE', 7), \
+                    mock.patch.object(main, '_PAIR_CHUNK_SIZE', 50):
+                self.assertEqual(self.shared_families(mode), expected)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.shared_families('fast')
+
+
+if __name__ == '__main__':
+    unittest.main()